@@ -0,0 +1,43 @@
+import argparse
+
+from benchmarks.bench_normalisation import synthetic_messages
+from data.automated import automated_perturbation
+from models import registry
+from models.cascade import DEFAULT_BANDS, cascade_report, cascade_tradeoff
+
+# Compares the cascaded scorer with running the full scorer on every text: time taken, escalation rate and
+# agreement of the verdicts, for the default confidence band and then for a sweep of bands. Half of the texts
+# are run through the automated attacks so that the obfuscation triage has something to catch.
+# Run from the repository root: python -m benchmarks.bench_cascade --n 2000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--escalate-to", choices=["detoxify", "hatexplain", "perspective"], default="detoxify")
+    parser.add_argument("--bands", type=float, nargs="+",
+                        default=[0.5, 0.5, 0.3, 0.7, 0.2, 0.8, 0.1, 0.9, 0.05, 0.95],
+                        help="low/high pairs of confidence bands to sweep")
+    args = parser.parse_args()
+
+    texts = synthetic_messages(args.n, seed=0)
+    half = args.n // 2
+    texts = texts[:half] + automated_perturbation(texts[half:], seed=0, offset=half)
+
+    # Every run has to pay for inference, so the on-disk score cache is switched off
+    registry.override("score_cache", None)
+    registry.preload("detoxify_small", *(("detoxify",) if args.escalate_to == "detoxify" else ()))
+
+    report = cascade_report(texts, args.escalate_to, DEFAULT_BANDS)
+    print(f"cascade (bands={DEFAULT_BANDS}): {report['cascade_seconds']:.2f}s, "
+          f"full {args.escalate_to}: {report['full_seconds']:.2f}s, "
+          f"escalation rate {report['escalation_rate']:.3f}, agreement {report['agreement']:.3f} "
+          f"(triaged only {report['triage_agreement']:.3f}), "
+          f"false negatives {report['false_negatives']}, false positives {report['false_positives']}")
+
+    bands = list(zip(args.bands[::2], args.bands[1::2]))
+    print(cascade_tradeoff(texts, bands, args.escalate_to).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
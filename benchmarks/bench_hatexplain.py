@@ -0,0 +1,45 @@
+import argparse
+import random
+import time
+
+from models import registry
+from models.hatexplain import hatexplain, hatexplain_sequential
+
+# Throughput comparison between the original per-text HateXplain loop and the batched, length-bucketed path.
+# Run from the repository root: python -m benchmarks.bench_hatexplain --n 500
+
+WORDS = ["you", "are", "such", "a", "total", "idiot", "get", "out", "of", "here", "people", "like", "them",
+         "should", "never", "be", "allowed", "to", "speak", "this", "is", "fine", "have", "nice", "day"]
+
+
+def synthetic_texts(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 60))) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[8, 32, 64])
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.n)
+    # Every run has to pay for inference, so the on-disk score cache is switched off
+    registry.override("score_cache", None)
+
+    start = time.perf_counter()
+    reference = hatexplain_sequential(texts)
+    elapsed = time.perf_counter() - start
+    print(f"sequential: {elapsed:.2f}s ({len(texts) / elapsed:.1f} texts/s)")
+
+    for batch_size in args.batch_size:
+        start = time.perf_counter()
+        labels = hatexplain(texts, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        agreement = sum(a == b for a, b in zip(reference, labels)) / len(texts)
+        print(f"batched (batch_size={batch_size}): {elapsed:.2f}s ({len(texts) / elapsed:.1f} texts/s), "
+              f"label agreement with sequential: {agreement:.3f}")
+
+
+if __name__ == "__main__":
+    main()
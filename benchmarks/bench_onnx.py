@@ -0,0 +1,78 @@
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.bench_hatexplain import synthetic_texts
+from models import registry
+from models.detoxify_model import evaluate_toxicity
+from models.hatexplain import hatexplain
+
+# Accuracy parity and speed of the quantised ONNX Runtime backend against the PyTorch one, for HateXplain and
+# Detoxify. Parity is label agreement for HateXplain, and per-class score deltas plus agreement of the toxic verdict
+# for Detoxify. Speed is throughput over the whole corpus and latency of single-text calls, as a server without
+# batching would see it. The first ONNX run exports and quantises the models into ONNX_MODEL_PATH.
+# Run from the repository root: python -m benchmarks.bench_onnx --n 500 --latency-n 100
+
+DECISION_THRESHOLD = 0.5
+
+
+def _timed(fn, texts):
+    start = time.perf_counter()
+    result = fn(texts)
+    return result, time.perf_counter() - start
+
+
+def _latencies(fn, texts):
+    latencies = []
+    for text in texts:
+        start = time.perf_counter()
+        fn([text])
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+
+def compare(name, run, texts, latency_texts):
+    # run(texts, backend) -> result. Returns the results of both backends after printing their speed
+    results = {}
+    for backend in ("torch", "onnx"):
+        # The first call loads the model (and exports it on the ONNX side), which is not what is being measured
+        run(texts[:1], backend)
+        results[backend], elapsed = _timed(lambda batch: run(batch, backend), texts)
+        ms = _latencies(lambda batch: run(batch, backend), latency_texts)
+        print(f"{name} {backend}: {elapsed:.2f}s ({len(texts) / elapsed:.1f} texts/s), "
+              f"single-text p50 {np.percentile(ms, 50):.1f}ms, p99 {np.percentile(ms, 99):.1f}ms")
+    return results["torch"], results["onnx"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=500)
+    parser.add_argument("--latency-n", type=int, default=100)
+    parser.add_argument("--models", nargs="+", choices=["hatexplain", "detoxify"], default=["hatexplain", "detoxify"])
+    args = parser.parse_args()
+
+    texts = synthetic_texts(args.n, seed=0)
+    latency_texts = synthetic_texts(args.latency_n, seed=1)
+    # Every run has to pay for inference, so the on-disk score cache is switched off
+    registry.override("score_cache", None)
+
+    if "hatexplain" in args.models:
+        reference, labels = compare("hatexplain", lambda batch, backend: hatexplain(batch, backend=backend),
+                                    texts, latency_texts)
+        agreement = sum(a == b for a, b in zip(reference, labels)) / len(texts)
+        print(f"hatexplain label agreement: {agreement:.4f}")
+
+    if "detoxify" in args.models:
+        reference, scores = compare("detoxify", lambda batch, backend: evaluate_toxicity(batch, backend=backend),
+                                    texts, latency_texts)
+        deltas = (scores[reference.columns] - reference).abs()
+        print(deltas.agg(["mean", "max"]).T.rename(columns={"mean": "mean_abs_delta", "max": "max_abs_delta"})
+              .to_string(float_format="{:.5f}".format))
+        toxic = reference["toxicity"] >= DECISION_THRESHOLD
+        agreement = ((scores["toxicity"] >= DECISION_THRESHOLD) == toxic).mean()
+        print(f"detoxify toxic verdict agreement: {agreement:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+from benchmarks.bench_normalisation import synthetic_messages
+from mitigations.detection_spellcheck import detect_and_spellcheck
+from mitigations.normalisation import normalise_texts
+from mitigations.parallel import parallel_detect_and_spellcheck, parallel_normalise
+
+# Scaling of the process-pool mitigations with the number of workers, checked against the serial output.
+# Run from the repository root: python -m benchmarks.bench_parallel_mitigations --n 200000 --workers 1 2 4 8
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({1, 2, 4, 8, 16, 32, cpus} & set(range(1, cpus + 1)))
+    messages = synthetic_messages(args.n)
+    # Loads the spelling index and lookup tables up front so the serial timing measures only the work itself
+    detect_and_spellcheck(messages[:100])
+
+    stages = [
+        ("normalise", lambda: normalise_texts(messages),
+         lambda w: parallel_normalise(messages, workers=w, chunk_size=args.chunk_size)),
+        ("detect_and_spellcheck", lambda: detect_and_spellcheck(messages),
+         lambda w: parallel_detect_and_spellcheck(messages, workers=w, chunk_size=args.chunk_size)),
+    ]
+
+    for name, serial, parallel in stages:
+        reference, serial_time = timed(serial)
+        print(f"{name} serial: {serial_time:.2f}s ({args.n / serial_time:,.0f} texts/s)")
+        for workers in worker_counts:
+            output, elapsed = timed(lambda: parallel(workers))
+            print(f"{name} workers={workers}: {elapsed:.2f}s ({args.n / elapsed:,.0f} texts/s), "
+                  f"speedup x{serial_time / elapsed:.2f}, identical={output == reference}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from models import registry
+from models.perspective import evaluate_perspective
+
+# Runs evaluate_perspective against a local stub of the Perspective endpoint that adds latency and
+# randomly answers 429 or 503, to check throughput, retries and output order without using real quota.
+# Run from the repository root: python -m benchmarks.bench_perspective --n 200 --qps 50
+
+
+def make_handler(latency, error_rate):
+
+    class StubHandler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+
+            if random.random() < error_rate:
+                self.send_response(random.choice([429, 503]))
+                self.send_header("Retry-After", "0.05")
+                self.end_headers()
+                return
+
+            # The stub's score is a deterministic function of the text so the output order can be checked
+            text = body["comment"]["text"]
+            payload = {"attributeScores": {"TOXICITY": {"summaryScore": {"value": len(text) / 1000}}}}
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200)
+    parser.add_argument("--qps", type=float, default=50)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency, args.error_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/v1alpha1/comments:analyze"
+
+    # Every run has to hit the stub, so the on-disk score cache is switched off
+    registry.override("score_cache", None)
+
+    for workers in args.workers:
+        texts = [f"text {workers} {i} " + "x" * i for i in range(args.n)]
+        start = time.perf_counter()
+        scores = evaluate_perspective(texts, max_workers=workers, qps=args.qps, endpoint=endpoint)["toxicity"].tolist()
+        elapsed = time.perf_counter() - start
+
+        in_order = all(s is None or abs(s - len(t) / 1000) < 1e-12 for s, t in zip(scores, texts))
+        failed = sum(s is None for s in scores)
+        print(f"workers={workers}: {elapsed:.2f}s ({len(texts) / elapsed:.1f} req/s), "
+              f"failed={failed}, order preserved={in_order}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import json
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+from benchmarks.bench_normalisation import synthetic_messages
+from models import registry
+from serving.server import make_server, moderation_pipeline
+
+# Load generator for the moderation service. A number of client threads each send requests back to back (a
+# closed loop), and the client-side latency percentiles and throughput are reported next to the server's /stats.
+# Without --url a server is started in this process for every --max-batch-size given, so batching settings can
+# be compared on the same machine. Run from the repository root:
+#   python -m benchmarks.bench_serving --requests 2000 --concurrency 1 8 32 --max-batch-size 1 8 32
+
+
+def _post(url, text):
+    request = urllib.request.Request(url + "/moderate", data=json.dumps({"text": text}).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def _get(url, path):
+    with urllib.request.urlopen(url + path, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def generate_load(url, texts, concurrency):
+    # Sends every text once, spread over `concurrency` client threads. Returns (latencies in seconds, errors,
+    # wall-clock seconds)
+    latencies = []
+    errors = []
+    position = iter(range(len(texts)))
+    lock = threading.Lock()
+
+    def client():
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            start = time.perf_counter()
+            try:
+                _post(url, texts[i])
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+                continue
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return np.array(latencies), errors, time.perf_counter() - start
+
+
+def report(label, latencies, errors, elapsed, server_stats):
+    ms = latencies * 1000
+    print(f"{label}: {len(latencies) / elapsed:.1f} req/s, "
+          f"p50 {np.percentile(ms, 50):.1f}ms, p99 {np.percentile(ms, 99):.1f}ms, errors {len(errors)}; "
+          f"server mean batch size {server_stats['mean_batch_size']:.1f}, "
+          f"server p50 {server_stats['latency_ms']['p50']:.1f}ms, p99 {server_stats['latency_ms']['p99']:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="load an already running server instead of starting one")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-batch-size", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--mitigation", choices=["none", "norm", "spellcheck"], default="norm")
+    parser.add_argument("--no-labels", action="store_true")
+    args = parser.parse_args()
+
+    # Distinct texts for every run so nothing is answered from a cache
+    texts = synthetic_messages(args.requests * len(args.concurrency) * len(args.max_batch_size), seed=0)
+    batches = iter(texts[i:i + args.requests] for i in range(0, len(texts), args.requests))
+
+    if args.url:
+        for concurrency in args.concurrency:
+            latencies, errors, elapsed = generate_load(args.url, next(batches), concurrency)
+            report(f"concurrency={concurrency}", latencies, errors, elapsed, _get(args.url, "/stats"))
+        return
+
+    # Every request has to pay for inference, so the on-disk score cache is switched off
+    registry.override("score_cache", None)
+    pipeline = moderation_pipeline(args.mitigation, not args.no_labels)
+    registry.preload("detoxify", *(() if args.no_labels else ("hatexplain",)))
+    if args.mitigation == "spellcheck":
+        registry.preload("symspell")
+    pipeline(["warm up"])
+
+    for max_batch_size in args.max_batch_size:
+        for concurrency in args.concurrency:
+            server, batcher = make_server(pipeline, port=0, max_batch_size=max_batch_size,
+                                          max_wait=args.max_wait_ms / 1000)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            try:
+                latencies, errors, elapsed = generate_load(url, next(batches), concurrency)
+                report(f"max_batch_size={max_batch_size} concurrency={concurrency}", latencies, errors, elapsed,
+                       _get(url, "/stats"))
+            finally:
+                server.shutdown()
+                server.server_close()
+                batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+
+from mitigations.detection_spellcheck import soft_normalise, textblob_correct
+from mitigations.spelling import SymSpellCorrector
+
+# Accuracy and throughput of the SymSpell corrector against TextBlob.correct() on misspelt and leetspeak
+# versions of dictionary words. Run from the repository root: python -m benchmarks.bench_spelling --n 2000
+
+LEET = {"a": "4", "e": "3", "i": "1", "l": "1", "o": "0", "s": "5", "t": "7", "b": "8", "g": "9"}
+
+
+def misspell(word, rng):
+    roll = rng.random()
+    if roll < 0.3:
+        return "".join(LEET.get(c, c) if rng.random() < 0.5 else c for c in word)
+
+    chars = list(word)
+    for _ in range(rng.choice([1, 1, 2])):
+        i = rng.randrange(len(chars))
+        op = rng.choice(["delete", "insert", "replace", "transpose"])
+        if op == "delete" and len(chars) > 2:
+            del chars[i]
+        elif op == "insert":
+            chars.insert(i, rng.choice(string.ascii_lowercase))
+        elif op == "replace":
+            chars[i] = rng.choice(string.ascii_lowercase)
+        elif op == "transpose" and i + 1 < len(chars):
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return "".join(chars)
+
+
+def evaluate(label, correct, pairs):
+    start = time.perf_counter()
+    outputs = [correct(noisy) for noisy, _ in pairs]
+    elapsed = time.perf_counter() - start
+    accuracy = sum(out == word for out, (_, word) in zip(outputs, pairs)) / len(pairs)
+    print(f"{label}: accuracy {accuracy:.3f}, {elapsed:.2f}s ({len(pairs) / elapsed:,.0f} words/s)")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    corrector = SymSpellCorrector.from_textblob()
+    print(f"index build: {time.perf_counter() - start:.2f}s ({len(corrector.index):,} delete keys)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "symspell_index.pkl")
+        corrector.save(path)
+        start = time.perf_counter()
+        corrector = SymSpellCorrector.load(path)
+        print(f"index load: {time.perf_counter() - start:.2f}s ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+    rng = random.Random(args.seed)
+    vocabulary = [w for w, count in corrector.frequencies.items() if count >= 5 and len(w) >= 4 and w.isalpha()]
+    words = [rng.choice(vocabulary) for _ in range(args.n)]
+    pairs = [(soft_normalise(misspell(w, rng)), w) for w in words]
+
+    textblob_out = evaluate("textblob", textblob_correct, pairs)
+    symspell_out = evaluate("symspell (cold memo)", corrector.correct, pairs)
+    evaluate("symspell (warm memo)", corrector.correct, pairs)
+
+    agreement = sum(a == b for a, b in zip(textblob_out, symspell_out)) / len(pairs)
+    print(f"agreement between engines: {agreement:.3f}")
+
+
+if __name__ == "__main__":
+    main()
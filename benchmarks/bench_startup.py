@@ -0,0 +1,55 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Guards the cold import time of run.py. Importing it must not load any model or heavy ML library;
+# those are only built on first use through models.registry.
+# Run from the repository root: python -m benchmarks.bench_startup
+
+HEAVY_MODULES = ["torch", "transformers", "detoxify", "sentence_transformers", "textattack", "textblob",
+                 "datasets", "matplotlib", "seaborn", "textstat", "nltk", "scipy"]
+
+PROBE = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import run\n"
+    "elapsed = time.perf_counter() - start\n"
+    "print(elapsed)\n"
+    f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+)
+
+
+def measure_import():
+    out = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True, check=True).stdout.splitlines()
+    return float(out[0]), [m for m in out[1].split(",") if m]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    timings = []
+    heavy = []
+    for _ in range(args.repeats):
+        elapsed, heavy = measure_import()
+        timings.append(elapsed)
+
+    median = statistics.median(timings)
+    print(f"import run: median {median:.3f}s, min {min(timings):.3f}s, max {max(timings):.3f}s over {args.repeats} runs")
+
+    failed = False
+    if heavy:
+        print(f"[FAIL] heavy modules imported at startup: {', '.join(heavy)}")
+        failed = True
+    if median > args.max_seconds:
+        print(f"[FAIL] median import time {median:.3f}s exceeds the {args.max_seconds:.1f}s budget")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
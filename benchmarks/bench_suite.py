@@ -0,0 +1,379 @@
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import stand_ins
+from data.automated import ATTACKS, automated_perturbation, text_rng
+from evaluation import visualisation
+from evaluation.analysis import compute_levenshtein, compute_readability, compute_similarity
+from mitigations.detection_spellcheck import detect_and_spellcheck
+from mitigations.normalisation import normalise_text, normalise_texts
+from models import registry
+from models.detoxify_model import evaluate_toxicity
+from models.hatexplain import hatexplain
+
+# Benchmark suite over every pipeline stage, run offline on a synthetic corpus. The clean side is made of random
+# sentences over a small vocabulary and the perturbed side applies the automated attacks to a chosen share of
+# them, so the obfuscation mix is configurable. Models are replaced by the tiny stand-ins in benchmarks.stand_ins
+# unless --real-models is given, and the score cache is off, so every stage does its full work on every repeat.
+#
+# `run` writes one JSON document: the corpus settings and machine under "meta", and per stage the wall-clock
+# seconds of every repeat with their median and the texts/s it corresponds to. `compare` checks a run against a
+# stored baseline and exits with status 1 if any stage got slower by more than the tolerance, or if a stage timed
+# in the baseline failed or is missing in the current run (unless --allow-missing is given, for comparing a run of
+# only some stages).
+# Run from the repository root:
+#   python -m benchmarks.bench_suite run --n 2000 --obfuscation 0.5 --output bench_results.json
+#   python -m benchmarks.bench_suite compare bench_baseline.json bench_results.json --tolerance 0.2
+
+DEFAULT_REPEATS = 3
+DEFAULT_TOLERANCE = 0.2
+# Stages faster than this are dominated by timer noise and are never flagged
+MIN_SECONDS = 0.005
+WARMUP_TEXTS = 16
+# Corpus settings that must match for a comparison to be like for like
+COMPARABLE_META = ("n", "obfuscation", "attacks", "seed", "models")
+CONDITIONS = ["norm", "spellcheck", "human", "human_norm", "human_spellcheck", "auto", "auto_norm",
+              "auto_spellcheck"]
+
+STAGES = {}
+
+
+def stage(name):
+    # Registers build(corpus) -> zero-argument callable. build does any per-repeat setup, untimed, and only
+    # the returned callable is timed
+    def register(build):
+        STAGES[name] = build
+        return build
+    return register
+
+
+def synthetic_corpus(n, obfuscation=0.5, attacks=None, seed=0):
+    # n clean texts of one to three sentences, and the same texts with a share `obfuscation` of them put through
+    # one of `attacks` (names in data.automated.ATTACKS, all of them by default). Text i is driven by
+    # text_rng(seed, i), so a corpus is reproducible from its settings
+    attacks = [ATTACKS[name] for name in (attacks or ATTACKS)]
+    rng = random.Random(seed)
+    clean = []
+    for _ in range(n):
+        sentences = [" ".join(rng.choice(stand_ins.VOCABULARY) for _ in range(rng.randint(3, 15)))
+                     for _ in range(rng.randint(1, 3))]
+        clean.append(" ".join(s.capitalize() + rng.choice(".!?") for s in sentences))
+
+    perturbed = []
+    for i, text in enumerate(clean):
+        text_gen = text_rng(seed, i)
+        if text_gen.random() < obfuscation:
+            text = attacks[int(text_gen.integers(len(attacks)))](text, text_gen)
+        perturbed.append(text)
+    return {"clean": clean, "perturbed": perturbed, "seed": seed}
+
+
+def _head(corpus, n):
+    return {**corpus, "clean": corpus["clean"][:n], "perturbed": corpus["perturbed"][:n]}
+
+
+@stage("normalise_text")
+def _normalise_text(corpus):
+    return lambda: [normalise_text(t) for t in corpus["perturbed"]]
+
+
+@stage("normalise_texts")
+def _normalise_texts(corpus):
+    return lambda: normalise_texts(corpus["perturbed"])
+
+
+@stage("detect_and_spellcheck")
+def _detect_and_spellcheck(corpus):
+    # Every repeat starts from a cold correction memo
+    registry.get("symspell").correct_token.cache_clear()
+    return lambda: detect_and_spellcheck(corpus["perturbed"])
+
+
+def _attack_stage(attack):
+    def build(corpus):
+        return lambda: [attack(t, text_rng(corpus["seed"], i)) for i, t in enumerate(corpus["clean"])]
+    return build
+
+
+for _name, _attack in ATTACKS.items():
+    stage(f"attack:{_name}")(_attack_stage(_attack))
+
+
+@stage("automated_perturbation")
+def _automated_perturbation(corpus):
+    return lambda: automated_perturbation(corpus["clean"], seed=corpus["seed"])
+
+
+@stage("evaluate_toxicity")
+def _evaluate_toxicity(corpus):
+    return lambda: evaluate_toxicity(corpus["perturbed"])
+
+
+@stage("hatexplain")
+def _hatexplain(corpus):
+    return lambda: hatexplain(corpus["perturbed"])
+
+
+@stage("compute_similarity")
+def _compute_similarity(corpus):
+    return lambda: compute_similarity(corpus["clean"], corpus["perturbed"])
+
+
+@stage("compute_levenshtein")
+def _compute_levenshtein(corpus):
+    return lambda: compute_levenshtein(corpus["clean"], corpus["perturbed"])
+
+
+@stage("compute_readability")
+def _compute_readability(corpus):
+    return lambda: compute_readability(corpus["clean"], corpus["perturbed"])
+
+
+def _plot_inputs(n, seed):
+    # Frames shaped like the ones run.py passes to the plotting functions, with n rows per condition
+    rng = np.random.default_rng(seed)
+    column = lambda name, values: {c: pd.DataFrame({name: values()}) for c in CONDITIONS}
+    return {
+        "summaries": column("mean_drop", lambda: rng.normal(0.05, 0.02, 1)),
+        "scores": column("toxicity", lambda: rng.random(n)),
+        "other_scores": column("toxicity", lambda: rng.random(n)),
+        "label_changes": {c: pd.DataFrame({"normal_to_toxic_rate": rng.random(1),
+                                           "toxic_to_normal_rate": rng.random(1)}) for c in CONDITIONS},
+        "similarity": [pd.DataFrame({"similarity": rng.random(n)}) for _ in range(2)],
+        "levenshtein": column("lev_distance", lambda: rng.integers(0, 40, n)),
+        "readability": column("flesch_change", lambda: rng.normal(0, 20, n)),
+    }
+
+
+PLOTS = {
+    "plot_bar": lambda inputs, path: (visualisation.plot_bar, {"results_dict": inputs["summaries"], "save_path": path}),
+    "plot_box": lambda inputs, path: (visualisation.plot_box, {"results_dict": inputs["scores"], "save_path": path}),
+    "plot_scatter": lambda inputs, path: (visualisation.plot_scatter, {"scores_x": inputs["scores"],
+                                                                       "scores_y": inputs["other_scores"],
+                                                                       "save_path": path}),
+    "plot_label_changes": lambda inputs, path: (visualisation.plot_label_changes,
+                                                {"results_dict": inputs["label_changes"], "save_path": path}),
+    "plot_similarity_distributions": lambda inputs, path: (visualisation.plot_similarity_distributions,
+                                                           {"human_df": inputs["similarity"][0],
+                                                            "auto_df": inputs["similarity"][1], "save_path": path}),
+    "plot_levenshtein_box": lambda inputs, path: (visualisation.plot_levenshtein_box,
+                                                  {"results": inputs["levenshtein"], "save_path": path}),
+    "plot_readability_box": lambda inputs, path: (visualisation.plot_readability_box,
+                                                  {"results": inputs["readability"], "save_path": path}),
+}
+
+
+def _plot_stage(name, job):
+    def build(corpus):
+        func, kwargs = job(_plot_inputs(len(corpus["clean"]), corpus["seed"]),
+                           os.path.join(corpus["directory"], f"{name}.png"))
+        return lambda: func(**kwargs)
+    return build
+
+
+for _name, _job in PLOTS.items():
+    stage(f"plot:{_name}")(_plot_stage(_name, _job))
+
+
+@stage("plot:render_figures")
+def _render_figures(corpus):
+    # All figures at once across worker processes, as run.report() renders them
+    inputs = _plot_inputs(len(corpus["clean"]), corpus["seed"])
+    jobs = [job(inputs, os.path.join(corpus["directory"], f"{name}.png")) for name, job in PLOTS.items()]
+    return lambda: visualisation.render_figures(jobs)
+
+
+def time_stage(build, corpus, repeats):
+    # Seconds for each repeat, after one untimed call on a few texts that loads models and fills import caches
+    build(_head(corpus, WARMUP_TEXTS))()
+    seconds = []
+    for _ in range(repeats):
+        run = build(corpus)
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def select_stages(patterns):
+    if not patterns:
+        return list(STAGES)
+    selected = [name for name in STAGES if any(fnmatch.fnmatch(name, p) for p in patterns)]
+    if not selected:
+        raise ValueError(f"No stage matches {patterns}; stages are {list(STAGES)}")
+    return selected
+
+
+def run_suite(n=2000, obfuscation=0.5, attacks=None, seed=0, repeats=DEFAULT_REPEATS, stages=None,
+              real_models=False):
+    with tempfile.TemporaryDirectory() as directory:
+        if real_models:
+            registry.override("score_cache", None)
+            registry.override("embedding_store", None)
+        else:
+            stand_ins.install(directory, seed)
+
+        corpus = synthetic_corpus(n, obfuscation, attacks, seed)
+        corpus["directory"] = directory
+        results = {}
+        for name in select_stages(stages):
+            try:
+                seconds = time_stage(STAGES[name], corpus, repeats)
+            except Exception as e:
+                # A stage that cannot run here (missing corpus data, say) is recorded and skipped
+                results[name] = {"error": f"{type(e).__name__}: {' '.join(str(e).split())}"}
+                print(f"{name}: failed ({results[name]['error'][:200]})")
+                continue
+
+            median = float(np.median(seconds))
+            results[name] = {
+                "seconds": seconds,
+                "median_s": median,
+                "min_s": min(seconds),
+                "texts": n,
+                "texts_per_s": n / median if median > 0 else None,
+            }
+            print(f"{name}: median {median:.3f}s over {repeats} repeats ({n / median:,.0f} texts/s)")
+
+    return {
+        "meta": {
+            "n": n,
+            "obfuscation": obfuscation,
+            "attacks": sorted(attacks or ATTACKS),
+            "seed": seed,
+            "repeats": repeats,
+            "models": "real" if real_models else "stand-in",
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+
+def compare_results(baseline, current, tolerance=DEFAULT_TOLERANCE, min_seconds=MIN_SECONDS):
+    # One row per stage with the ratio of median times (current / baseline) and a status: "regression" when it
+    # is above 1 + tolerance, "improvement" when below 1 / (1 + tolerance), "missing" or "failed" when the
+    # current run has no timing for a stage the baseline has, and "ok" otherwise
+    rows = []
+    for name, base in baseline["results"].items():
+        if "median_s" not in base:
+            continue
+        cur = current["results"].get(name)
+        row = {"stage": name, "baseline_s": base["median_s"], "current_s": None, "ratio": None}
+        if cur is None:
+            row["status"] = "missing"
+        elif "median_s" not in cur:
+            row["status"] = "failed"
+        else:
+            ratio = cur["median_s"] / base["median_s"] if base["median_s"] > 0 else float("inf")
+            row.update(current_s=cur["median_s"], ratio=ratio)
+            if max(base["median_s"], cur["median_s"]) < min_seconds:
+                row["status"] = "ok"
+            elif ratio > 1 + tolerance:
+                row["status"] = "regression"
+            elif ratio < 1 / (1 + tolerance):
+                row["status"] = "improvement"
+            else:
+                row["status"] = "ok"
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["stage", "baseline_s", "current_s", "ratio", "status"])
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write(path, document):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on a synthetic corpus")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="time the stages and write the results as JSON")
+    run_parser.add_argument("--n", type=int, default=2000, help="texts in the synthetic corpus")
+    run_parser.add_argument("--obfuscation", type=float, default=0.5, help="share of texts that are perturbed")
+    run_parser.add_argument("--attacks", nargs="+", choices=list(ATTACKS), help="attacks in the mix (default all)")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS)
+    run_parser.add_argument("--stages", nargs="+", help="stage names or glob patterns, e.g. 'attack:*'")
+    run_parser.add_argument("--real-models", action="store_true", help="load the real models instead of stand-ins")
+    run_parser.add_argument("--output", default="bench_results.json")
+    run_parser.add_argument("--list", action="store_true", help="list the stages and exit")
+
+    compare_parser = commands.add_parser("compare", help="flag stages that got slower than a stored baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                                help="allowed slowdown as a fraction of the baseline time")
+    compare_parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS)
+    compare_parser.add_argument("--allow-missing", action="store_true",
+                                help="do not fail when a stage timed in the baseline failed or is missing in the "
+                                     "current run")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        if args.list:
+            print("\n".join(STAGES))
+            return 0
+        document = run_suite(args.n, args.obfuscation, args.attacks, args.seed, args.repeats, args.stages,
+                             args.real_models)
+        _write(args.output, document)
+        print(f"Results written to {args.output}")
+        return 0
+
+    baseline, current = _read(args.baseline), _read(args.current)
+    for key in COMPARABLE_META:
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"[WARN] {key} differs: baseline {baseline['meta'].get(key)!r}, "
+                  f"current {current['meta'].get(key)!r}")
+
+    table = compare_results(baseline, current, args.tolerance, args.min_seconds)
+    print(table.to_string(index=False, float_format="{:.3f}".format))
+    failed = False
+    regressions = table[table["status"] == "regression"]
+    if len(regressions):
+        print(f"[FAIL] {len(regressions)} stage(s) slower than the baseline by more than "
+              f"{args.tolerance:.0%}: {', '.join(regressions['stage'])}")
+        failed = True
+    broken = table[table["status"].isin(["failed", "missing"])]
+    if len(broken):
+        print(f"[{'WARN' if args.allow_missing else 'FAIL'}] {len(broken)} stage(s) timed in the baseline failed "
+              f"or are missing in the current run: {', '.join(broken['stage'])}")
+        failed = failed or not args.allow_missing
+    if failed:
+        return 1
+    print("No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import os
+import random
+import string
+
+import numpy as np
+
+from benchmarks.bench_hatexplain import WORDS as HATEXPLAIN_WORDS
+from benchmarks.bench_normalisation import ACCENTS, WORDS
+from models import registry
+
+# Tiny randomly initialised stand-ins for every model the pipeline loads, so benchmarks run offline and in
+# seconds. Each has the interface of the model it replaces and does the same kind of work (WordPiece tokenisation,
+# BERT forward passes, dictionary lookups), only at a much smaller size, so timings follow the pipeline code around
+# the models rather than the models themselves. Their scores are meaningless.
+
+VOCABULARY = sorted(set(WORDS) | set(HATEXPLAIN_WORDS))
+SPECIAL_TOKENS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+DETOXIFY_CLASSES = ["toxicity", "severe_toxicity", "obscene", "threat", "insult", "identity_attack"]
+HIDDEN_SIZE = 64
+LAYERS = 2
+MAX_LENGTH = 512
+# Made-up words padding out the spelling dictionary and the synonym table to a realistic lookup cost
+DICTIONARY_SIZE = 20_000
+
+
+def pseudo_words(n, seed=0):
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10))))
+    return sorted(words)
+
+
+def stand_in_tokenizer(directory):
+    # WordPiece over the benchmark vocabulary plus single characters, so obfuscated words split into several
+    # pieces instead of collapsing to [UNK]
+    from transformers import BertTokenizerFast
+
+    characters = sorted(set(string.ascii_lowercase + string.digits + string.punctuation + "".join(ACCENTS.values())))
+    path = os.path.join(directory, "vocab.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(SPECIAL_TOKENS + VOCABULARY + characters + [f"##{c}" for c in characters]))
+    return BertTokenizerFast(vocab_file=path, model_max_length=MAX_LENGTH)
+
+
+def _bert_config(vocab_size, **kwargs):
+    from transformers import BertConfig
+
+    return BertConfig(vocab_size=vocab_size, hidden_size=HIDDEN_SIZE, num_hidden_layers=LAYERS,
+                      num_attention_heads=4, intermediate_size=4 * HIDDEN_SIZE, max_position_embeddings=MAX_LENGTH,
+                      **kwargs)
+
+
+def stand_in_classifier(tokenizer, num_labels, seed=0):
+    import torch
+    from transformers import BertForSequenceClassification
+
+    torch.manual_seed(seed)
+    model = BertForSequenceClassification(_bert_config(len(tokenizer), num_labels=num_labels))
+    model.eval()
+    return model
+
+
+class StandInDetoxify:
+    # Same predict() as detoxify.Detoxify: one padded batch, a sigmoid per class, {class: [score per text]}
+
+    def __init__(self, tokenizer, seed=0):
+        self.tokenizer = tokenizer
+        self.model = stand_in_classifier(tokenizer, len(DETOXIFY_CLASSES), seed)
+        self.class_names = list(DETOXIFY_CLASSES)
+
+    def predict(self, texts):
+        import torch
+
+        inputs = self.tokenizer(list(texts), return_tensors="pt", truncation=True, padding=True)
+        with torch.inference_mode():
+            scores = torch.sigmoid(self.model(**inputs)[0]).numpy()
+        return {name: scores[:, i].tolist() for i, name in enumerate(self.class_names)}
+
+
+class StandInSentenceTransformer:
+    # Mean-pooled BERT embeddings behind SentenceTransformer.encode()
+
+    def __init__(self, tokenizer, seed=0):
+        import torch
+        from transformers import BertModel
+
+        torch.manual_seed(seed)
+        self.tokenizer = tokenizer
+        self.model = BertModel(_bert_config(len(tokenizer)))
+        self.model.eval()
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False):
+        import torch
+
+        texts = list(texts)
+        out = np.zeros((len(texts), HIDDEN_SIZE), dtype=np.float32)
+        with torch.inference_mode():
+            for start in range(0, len(texts), batch_size):
+                inputs = self.tokenizer(texts[start:start + batch_size], return_tensors="pt", truncation=True,
+                                        padding=True)
+                hidden = self.model(**inputs).last_hidden_state
+                mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                out[start:start + batch_size] = ((hidden * mask).sum(1) / mask.sum(1).clamp(min=1)).numpy()
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+
+def stand_in_symspell(seed=0):
+    from mitigations.spelling import SymSpellCorrector
+
+    rng = random.Random(seed)
+    words = VOCABULARY + pseudo_words(DICTIONARY_SIZE, seed)
+    return SymSpellCorrector({word: rng.randint(1, 10_000) for word in words})
+
+
+def stand_in_synonyms(directory, seed=0):
+    # Synonym sets of three to six words, each benchmark word in one of them
+    from data.synonyms import build_synonym_index
+
+    rng = random.Random(seed)
+    words = VOCABULARY + pseudo_words(DICTIONARY_SIZE, seed + 1)
+    rng.shuffle(words)
+    synsets = []
+    while words:
+        size = rng.randint(3, 6)
+        synsets.append(words[:size])
+        words = words[size:]
+    return build_synonym_index(synsets, path=os.path.join(directory, "synonyms"))
+
+
+def install(directory, seed=0):
+    # Puts a stand-in under every model name in the registry and switches off the score cache and embedding
+    # store, so every call does its work. directory holds the tokenizer vocabulary and the synonym table
+    tokenizer = stand_in_tokenizer(directory)
+    registry.override("detoxify", StandInDetoxify(tokenizer, seed))
+    registry.override("detoxify_small", StandInDetoxify(tokenizer, seed + 1))
+    registry.override("hatexplain", (tokenizer, stand_in_classifier(tokenizer, 3, seed)))
+    registry.override("sentence_transformer", StandInSentenceTransformer(tokenizer, seed))
+    registry.override("symspell", stand_in_symspell(seed))
+    registry.override("synonyms", stand_in_synonyms(directory, seed))
+    registry.override("score_cache", None)
+    registry.override("embedding_store", None)
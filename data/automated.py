@@ -1,71 +1,162 @@
-from textattack.augmentation import WordNetAugmenter
-import random
+import re
+
+import numpy as np
+
+from models import registry
 
 LEET_MAP = {"a": "4", "e": "3", "i": "1", "o": "0", "s": "5", "t": "7"}
+LEET_TABLE = str.maketrans({**LEET_MAP, **{k.upper(): v for k, v in LEET_MAP.items()}})
+
+PUNCTUATION = ["*", "-", "~", ".", "!", "…"]
+
+# Share of words swapped by synonym_substitution, the same default as textattack's WordNetAugmenter
+SYNONYM_SWAP_RATE = 0.1
+
+# Function words are never swapped, as with the stopword constraint of the WordNet augmenter
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers herself
+him himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or
+other our ours ourselves out over own same she should so some such than that the their theirs them themselves then
+there these they this those through to too under until up very was we were what when where which while who whom why
+will with would you your yours yourself yourselves
+""".split())
+
+_WORD = re.compile(r"[A-Za-z]+")
+
+
+def _load_synonyms():
+    from data.synonyms import load_synonym_index
+    return load_synonym_index()
+
 
+registry.register("synonyms", _load_synonyms)
 
-def random_char_noise(text):
+
+def text_rng(seed, index):
+    # Generator for one text, derived from the run seed and the text's position in the corpus rather than from
+    # shared global state, so any slice of the corpus gets the same perturbations however the work is split up
+    return np.random.default_rng(np.random.SeedSequence([seed, index]))
+
+
+def _insert_after(text, positions, inserts):
+    # Rebuilds text with inserts[k] placed after character positions[k], slicing between insertions instead of
+    # visiting every character in Python
+    pieces = []
+    previous = 0
+    for position, insert in zip(positions.tolist(), inserts):
+        pieces.append(text[previous:position + 1])
+        pieces.append(insert)
+        previous = position + 1
+    pieces.append(text[previous:])
+    return "".join(pieces)
+
+
+def random_char_noise(text, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
     if len(text) < 2:
         return text
-    i = random.randint(0, len(text) - 1)
-    ops = [
-        text[:i] + text[i]*2 + text[i+1:],
-        text[:i] + "" + text[i+1:],
-        text[:i] + random.choice("!?.*") + text[i:],
-    ]
-    return random.choice(ops)
+    i = int(rng.integers(len(text)))
+    op = int(rng.integers(3))
+    if op == 0:
+        return text[:i] + text[i]*2 + text[i+1:]
+    if op == 1:
+        return text[:i] + text[i+1:]
+    return text[:i] + "!?.*"[int(rng.integers(4))] + text[i:]
 
 
-def leetspeak(text):
-    return "".join(LEET_MAP.get(c.lower(), c) for c in text)
+def leetspeak(text, rng=None):
+    return text.translate(LEET_TABLE)
 
 
-def random_spacing(text):
-    return "".join(c + (" " if random.random() < 0.15 else "") for c in text)
+def random_spacing(text, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    positions = np.flatnonzero(rng.random(len(text)) < 0.15)
+    return _insert_after(text, positions, [" "] * len(positions))
 
 
-def random_casing(text):
-    return "".join(c.upper() if random.random() < 0.3 else c.lower() for c in text)
+def random_casing(text, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    mask = rng.random(len(text)) < 0.3
+    lower, upper = text.lower(), text.upper()
 
+    if len(lower) != len(text) or len(upper) != len(text):
+        # A few characters change length when their case changes (e.g. "ß" -> "SS"), so fall back per character
+        return "".join(c.upper() if m else c.lower() for c, m in zip(text, mask))
 
-def punctuation_injection(text):
-    punct = ["*", "-", "~", ".", "!", "…"]
-    return "".join(c + (random.choice(punct) if random.random() < 0.1 else "") for c in text)
+    lower_codes = np.frombuffer(lower.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    upper_codes = np.frombuffer(upper.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    return np.where(mask, upper_codes, lower_codes).tobytes().decode("utf-32-le", "surrogatepass")
 
-def synonym_substitution(text):
-    augmenter = WordNetAugmenter()
-    try:
-        augmented = augmenter.augment(text)
-        if augmented:
-            return augmented[0]
-    except Exception:
-        return text
-    return text
+
+def punctuation_injection(text, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    positions = np.flatnonzero(rng.random(len(text)) < 0.1)
+    inserts = [PUNCTUATION[i] for i in rng.integers(len(PUNCTUATION), size=len(positions)).tolist()]
+    return _insert_after(text, positions, inserts)
 
 
-def automated_perturbation(texts):
+def synonym_substitution(text, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    synonyms = registry.get("synonyms")
+
+    words = list(_WORD.finditer(text))
+    candidates = [m for m in words if m.group(0).lower() not in STOPWORDS and synonyms.count(m.group(0))]
+    if not candidates:
+        return text
 
-    attacks = [
-        synonym_substitution,
-        random_char_noise,
-        leetspeak,
-        random_spacing,
-        random_casing,
-        punctuation_injection,
-    ]
+    n_swaps = min(max(int(SYNONYM_SWAP_RATE * len(words)), 1), len(candidates))
+    chosen = sorted(rng.choice(len(candidates), size=n_swaps, replace=False).tolist())
+
+    pieces = []
+    previous = 0
+    for k in chosen:
+        match = candidates[k]
+        word = match.group(0)
+        replacement = synonyms.choice(word, rng)
+        if word.istitle():
+            replacement = replacement.title()
+        elif word.isupper():
+            replacement = replacement.upper()
+        pieces.append(text[previous:match.start()])
+        pieces.append(replacement)
+        previous = match.end()
+    pieces.append(text[previous:])
+    return "".join(pieces)
+
+
+ATTACKS = {
+    "synonym_substitution": synonym_substitution,
+    "random_char_noise": random_char_noise,
+    "leetspeak": leetspeak,
+    "random_spacing": random_spacing,
+    "random_casing": random_casing,
+    "punctuation_injection": punctuation_injection,
+}
+
+
+def automated_perturbation(texts, seed=None, offset=0):
+    # Text i gets its own generator seeded from (seed, offset + i), which picks the attack and drives it.
+    # Passing the same seed reproduces the output exactly, also when the corpus is processed in shards, as long as
+    # each shard passes the position of its first text as offset. Without a seed a fresh one is drawn per call
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+
+    attacks = list(ATTACKS.values())
 
     perturbed = []
-    for t in texts:
+    for i, t in enumerate(texts):
         if not t:
             perturbed.append("")
             continue
 
-        attack = random.choice(attacks)
+        rng = text_rng(seed, offset + i)
+        attack = attacks[int(rng.integers(len(attacks)))]
         try:
-            out = attack(t)
+            out = attack(t, rng)
         except Exception:
             out = t
 
         perturbed.append(out)
 
-    return perturbed
\ No newline at end of file
+    return perturbed
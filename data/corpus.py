@@ -0,0 +1,178 @@
+import hashlib
+import json
+import os
+from itertools import islice
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from data.automated import ATTACKS
+
+# Adversarial corpora: K variants of every source text under each selected attack, generated lazily and written
+# as size-bounded Parquet shards. Every record carries the seed that produced it, so any single variant can be
+# regenerated on its own with ATTACKS[attack](text, np.random.default_rng(seed)).
+#
+# Every shard's schema metadata records the settings of the run that wrote it (seed, attacks, variants, whether
+# ids were given) and a running SHA-256 of the source texts and ids it has covered so far, so a resumed run can
+# check that it would carry on the same corpus rather than append records from different inputs.
+
+SCHEMA = pa.schema([
+    ("source_id", pa.int64()),
+    ("attack", pa.string()),
+    ("seed", pa.uint64()),
+    ("text", pa.string()),
+])
+
+DEFAULT_MAX_ROWS = 250_000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+SHARD_PATTERN = "part-{:05d}.parquet"
+
+
+def variant_seed(seed, position, attack_index, variant):
+    return int(np.random.SeedSequence([seed, position, attack_index, variant]).generate_state(1, np.uint64)[0])
+
+
+def _iter_by_source(texts, attacks, variants, seed, ids, start):
+    names = list(ATTACKS) if attacks is None else list(attacks)
+    attack_indices = [list(ATTACKS).index(name) for name in names]
+    ids = iter(ids) if ids is not None else None
+
+    for position, text in enumerate(texts, start):
+        source_id = next(ids) if ids is not None else position
+        text = text if isinstance(text, str) else (str(text) if text is not None else "")
+
+        records = []
+        for name, attack_index in zip(names, attack_indices):
+            for variant in range(variants):
+                record_seed = variant_seed(seed, position, attack_index, variant)
+                try:
+                    out = ATTACKS[name](text, np.random.default_rng(record_seed)) if text else ""
+                except Exception:
+                    out = text
+                records.append((source_id, name, record_seed, out))
+        yield position, records
+
+
+def iter_perturbations(texts, attacks=None, variants=1, seed=0, ids=None, start=0):
+    # Yields (source_id, attack_name, seed, text) for every text, attack and variant, in that order.
+    # source_id defaults to the text's position in the corpus; start is the position of the first text, used
+    # when resuming part-way through so that seeds and ids carry on from where the previous run stopped
+    for _, records in _iter_by_source(texts, attacks, variants, seed, ids, start):
+        yield from records
+
+
+def _hashed(values, digest, tag):
+    # Passes values through, adding each one to digest as it is consumed
+    for value in values:
+        text = value if isinstance(value, str) else (str(value) if value is not None else "")
+        data = text.encode("utf-8", "surrogatepass")
+        digest.update(tag + len(data).to_bytes(8, "little") + data)
+        yield value
+
+
+def _run_settings(attacks, variants, seed, ids):
+    names = list(ATTACKS) if attacks is None else list(attacks)
+    return {"seed": str(seed), "attacks": json.dumps(names), "variants": str(variants),
+            "ids": "given" if ids is not None else "positions"}
+
+
+def _shards(out_dir):
+    return sorted(f for f in os.listdir(out_dir) if f.startswith("part-") and f.endswith(".parquet"))
+
+
+def _clear(out_dir):
+    # Removes the shards of a previous run, and shards it left half-written
+    for name in os.listdir(out_dir):
+        if (name.startswith("part-") and name.endswith(".parquet")) or \
+                (name.startswith(".part-") and name.endswith(".tmp")):
+            os.remove(os.path.join(out_dir, name))
+
+
+def _completed_positions(out_dir, settings):
+    # Shards are only ever renamed into place once fully written, so every visible shard is complete.
+    # Each one records the position of the first source text it does not contain, the settings of the run that
+    # wrote it and the digest of the sources up to that position. Raises ValueError if the settings differ
+    shards = _shards(out_dir)
+    if not shards:
+        return 0, 0, None
+    metadata = {key.decode(): value.decode()
+                for key, value in pq.read_metadata(os.path.join(out_dir, shards[-1])).metadata.items()}
+    differing = [key for key, value in settings.items() if metadata.get(key) != value]
+    if differing:
+        raise ValueError(f"Cannot resume the corpus in {out_dir}: it was written with different settings "
+                         f"({', '.join(differing)}); pass resume=False to rewrite it")
+    return len(shards), int(metadata["next_position"]), metadata.get("source_digest")
+
+
+def _write_shard(out_dir, shard_index, columns, next_position, settings, source_digest):
+    table = pa.Table.from_pydict(dict(zip(SCHEMA.names, columns)), schema=SCHEMA)
+    table = table.replace_schema_metadata({**settings, "next_position": str(next_position),
+                                           "source_digest": source_digest})
+    path = os.path.join(out_dir, SHARD_PATTERN.format(shard_index))
+    tmp_path = os.path.join(out_dir, "." + SHARD_PATTERN.format(shard_index) + ".tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+def write_perturbation_corpus(texts, out_dir, attacks=None, variants=1, seed=0, ids=None,
+                              max_rows=DEFAULT_MAX_ROWS, max_bytes=DEFAULT_MAX_BYTES, resume=True):
+    # Streams the records of iter_perturbations into shards of at most roughly max_rows rows or max_bytes of
+    # text. A shard is cut only between source texts, so with resume=True a rerun skips every text already
+    # covered by a complete shard without regenerating it and carries on with the next shard number, after
+    # checking that the settings and the texts and ids it skips are those the shards were written from (ValueError
+    # otherwise). With resume=False any shards already in out_dir are removed first
+    os.makedirs(out_dir, exist_ok=True)
+    settings = _run_settings(attacks, variants, seed, ids)
+    if resume:
+        shard_index, start, expected_digest = _completed_positions(out_dir, settings)
+    else:
+        _clear(out_dir)
+        shard_index, start, expected_digest = 0, 0, None
+
+    # Texts and ids go through the same digest, interleaved in the order _iter_by_source consumes them
+    source_digest = hashlib.sha256()
+    texts = _hashed(iter(texts), source_digest, b"t")
+    ids = _hashed(iter(ids), source_digest, b"i") if ids is not None else None
+    if start:
+        for _ in zip(islice(texts, start), islice(ids, start) if ids is not None else range(start)):
+            pass
+        if source_digest.hexdigest() != expected_digest:
+            raise ValueError(f"Cannot resume the corpus in {out_dir}: the first {start} texts or ids differ from "
+                             f"those it was written from; pass resume=False to rewrite it")
+        print(f"[INFO] Resuming after {shard_index} complete shards, at source text {start}")
+
+    columns = [[], [], [], []]
+    size = 0
+    written = []
+
+    for position, records in _iter_by_source(texts, attacks, variants, seed, ids, start):
+        for record in records:
+            for column, value in zip(columns, record):
+                column.append(value)
+            size += len(record[3])
+
+        if len(columns[0]) >= max_rows or size >= max_bytes:
+            written.append(_write_shard(out_dir, shard_index, columns, position + 1, settings,
+                                        source_digest.hexdigest()))
+            shard_index += 1
+            columns = [[], [], [], []]
+            size = 0
+
+    if columns[0]:
+        written.append(_write_shard(out_dir, shard_index, columns, position + 1, settings,
+                                    source_digest.hexdigest()))
+
+    return written
+
+
+def open_perturbation_corpus(out_dir):
+    # Opens all complete shards as one lazy Arrow dataset; partially written shards are hidden files and ignored
+    return ds.dataset(out_dir, format="parquet", schema=SCHEMA)
+
+
+def read_perturbation_corpus(out_dir, columns=None, filter=None):
+    # Only the requested columns and the rows matching filter are read from the shards
+    return open_perturbation_corpus(out_dir).to_table(columns=columns, filter=filter)
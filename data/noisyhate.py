@@ -1,29 +1,119 @@
-from datasets import load_dataset
-import pandas as pd
+import os
 
-def load_noisyhate():
+import pyarrow as pa
+import pyarrow.compute as pc
+
+DATASET_NAME = "NoisyHate/Noisy_Hate_Data"
+
+
+def _load_splits(source):
+    # A directory written by save_to_disk is memory-mapped with load_from_disk; anything else (a hub name, or a
+    # local directory or file of parquet/csv/json data) goes through load_dataset, whose Arrow cache files are
+    # memory-mapped too. Either way the tables are read lazily from disk rather than copied into memory
+    from datasets import Dataset, load_dataset, load_from_disk
+
+    if os.path.isdir(source) and any(os.path.exists(os.path.join(source, name))
+                                     for name in ("dataset_dict.json", "state.json")):
+        dataset = load_from_disk(source)
+    elif os.path.isfile(source):
+        builder = {".parquet": "parquet", ".csv": "csv", ".json": "json", ".jsonl": "json"}[
+            os.path.splitext(source)[1]]
+        dataset = load_dataset(builder, data_files=source)
+    else:
+        dataset = load_dataset(source)
+
+    return {"train": dataset} if isinstance(dataset, Dataset) else dict(dataset)
+
+
+def _to_arrow(split, columns=None):
+    # Zero-copy view of the split's memory-mapped Arrow table, projected to columns
+    if columns is not None:
+        split = split.select_columns([c for c in split.column_names if c in columns])
+    return split.with_format("arrow")[:]
+
+
+def _merged_names(clean_names, pert_names, suffixes):
+    # Output column names of an inner merge on id, as pandas names them: columns present in both splits get a suffix
+    shared = set(clean_names) & set(pert_names) - {"id"}
+    clean_out = {c: c + suffixes[0] if c in shared else c for c in clean_names}
+    pert_out = {c: c + suffixes[1] if c in shared else c for c in pert_names if c != "id"}
+    return clean_out, pert_out
 
-    # Some of the initial loading code is adapted from the original NoisyHate paper, which can be found here: https://arxiv.org/pdf/2303.10430
-    dataset = load_dataset("NoisyHate/Noisy_Hate_Data")
 
-    print("Available splits:", dataset.keys())
+def _pad(column, length):
+    if len(column) == length:
+        return column
+    return pa.chunked_array([*column.chunks, pa.nulls(length - len(column), column.type)], type=column.type)
 
-    if "clean" in dataset and "pert" in dataset:
-        df_clean = pd.DataFrame(dataset["clean"])
-        df_pert = pd.DataFrame(dataset["pert"])
 
-        if "id" in df_clean.columns and "id" in df_pert.columns:
-            df = df_clean.merge(df_pert, on="id", suffixes=("_clean", "_pert"))
+def merge_by_id(clean, pert, columns=None, start=0, stop=None, suffixes=("_clean", "_pert")):
+    # Inner join of two Arrow tables on a unique "id" that keeps the clean table's row order, like DataFrame.merge. Only
+    # the id columns are read to match rows; when the splits already line up row for row the result reuses
+    # their column buffers as they are, otherwise only the selected slice of the requested columns is gathered
+    clean_out, pert_out = _merged_names(clean.column_names, pert.column_names, suffixes)
+    if columns is not None:
+        clean_out = {c: name for c, name in clean_out.items() if name in columns}
+        pert_out = {c: name for c, name in pert_out.items() if name in columns}
+
+    clean_ids, pert_ids = clean.column("id"), pert.column("id")
+    if clean_ids.equals(pert_ids):
+        n = len(clean_ids)
+        start, stop, _ = slice(start, stop).indices(n)
+        length = max(stop - start, 0)
+        arrays = [clean.column(c).slice(start, length) for c in clean_out]
+        arrays += [pert.column(c).slice(start, length) for c in pert_out]
+        return pa.table(arrays, names=[*clean_out.values(), *pert_out.values()])
+
+    positions = pc.index_in(clean_ids, value_set=pert_ids)
+    matched = pc.is_valid(positions)
+    clean_rows = pc.indices_nonzero(matched)[start:stop]
+    pert_rows = pc.take(positions, clean_rows)
+
+    arrays = [clean.column(c).take(clean_rows) for c in clean_out]
+    arrays += [pert.column(c).take(pert_rows) for c in pert_out]
+    return pa.table(arrays, names=[*clean_out.values(), *pert_out.values()])
+
+
+def open_noisyhate(columns=None, start=0, stop=None, source=DATASET_NAME, split=None, verbose=False):
+    # Arrow view of rows start:stop of the requested columns (all columns if None). When the source has clean
+    # and pert splits they are merged on id (or placed side by side if they have no id column), otherwise the
+    # given split, or the first one, is used. source may be a hub dataset name or a local path
+    dataset = _load_splits(source)
+    if verbose:
+        print("Available splits:", dataset.keys())
+
+    if split is None and "clean" in dataset and "pert" in dataset:
+        clean_names, pert_names = dataset["clean"].column_names, dataset["pert"].column_names
+
+        if "id" in clean_names and "id" in pert_names:
+            # Project each split to the columns that end up in the requested output, plus the join key
+            clean_out, pert_out = _merged_names(clean_names, pert_names, ("_clean", "_pert"))
+            keep_clean = None if columns is None else {"id"} | {c for c, n in clean_out.items() if n in columns}
+            keep_pert = None if columns is None else {"id"} | {c for c, n in pert_out.items() if n in columns}
+            table = merge_by_id(_to_arrow(dataset["clean"], keep_clean), _to_arrow(dataset["pert"], keep_pert),
+                                columns, start, stop)
         else:
-            df = pd.concat([df_clean, df_pert], axis=1)
+            # Rows are paired by position, and the shorter split is padded with nulls as pd.concat would
+            clean = _to_arrow(dataset["clean"], columns)[start:stop]
+            pert = _to_arrow(dataset["pert"], columns)[start:stop]
+            length = max(len(clean), len(pert))
+            arrays = [_pad(column, length) for column in (*clean.columns, *pert.columns)]
+            table = pa.table(arrays, names=[*clean.column_names, *pert.column_names])
 
-        print("Loaded clean and perturbed splits successfully.")
-        return df
+        if verbose:
+            print("Loaded clean and perturbed splits successfully.")
+        return table
 
-    else:
-        split_name = list(dataset.keys())[0]
-        df = pd.DataFrame(dataset[split_name])
+    split_name = split if split is not None else list(dataset.keys())[0]
+    table = _to_arrow(dataset[split_name], columns)[start:stop]
+    if verbose:
         print(f"Loaded single split: {split_name}")
-        print("Columns:", df.columns.tolist())
-        print(df.head())
-        return df
+        print("Columns:", table.column_names)
+        print(table.slice(0, 5).to_pandas())
+    return table
+
+
+def load_noisyhate(columns=None, start=0, stop=None, source=DATASET_NAME, split=None):
+    # Some of the initial loading code is adapted from the original NoisyHate paper, which can be found here: https://arxiv.org/pdf/2303.10430
+    # Only the selected rows and columns are converted to pandas; without arguments this is the whole dataset
+    return open_noisyhate(columns, start, stop, source, split, verbose=True).to_pandas()
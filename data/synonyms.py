@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+
+# Compact word -> synonyms table precomputed from WordNet. It is stored as three .npy files that are memory-mapped
+# on load, so every process shares one copy of the pages and lookups need no WordNet calls at all:
+#   words.npy     sorted fixed-width byte strings, searched with np.searchsorted
+#   offsets.npy   int64, synonyms of words[i] are synonyms[offsets[i]:offsets[i + 1]]
+#   synonyms.npy  int32 indices into words
+
+INDEX_PATH = os.getenv("SYNONYM_INDEX_PATH", ".synonym_index")
+
+
+def wordnet_synsets():
+    # Lemma names of every WordNet synset, the same source textattack's WordNetAugmenter draws from
+    from nltk.corpus import wordnet
+
+    for synset in wordnet.all_synsets():
+        yield synset.lemma_names()
+
+
+def build_synonym_index(synsets=None, path=INDEX_PATH):
+    # Only single-word, purely alphabetic lemmas are kept, matching WordSwapWordNet's one-word replacements
+    synsets = wordnet_synsets() if synsets is None else synsets
+    table = {}
+    for lemmas in synsets:
+        words = sorted({w.lower() for w in lemmas if w.isalpha() and w.isascii()})
+        for word in words:
+            table.setdefault(word, set()).update(w for w in words if w != word)
+
+    vocabulary = sorted(table)
+    ids = {word: i for i, word in enumerate(vocabulary)}
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    synonyms = []
+    for i, word in enumerate(vocabulary):
+        synonyms.extend(sorted(ids[w] for w in table[word]))
+        offsets[i + 1] = len(synonyms)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "words.npy"), np.array([w.encode("ascii") for w in vocabulary], dtype=bytes))
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, "synonyms.npy"), np.array(synonyms, dtype=np.int32))
+    return SynonymIndex(path)
+
+
+class SynonymIndex:
+
+    def __init__(self, path=INDEX_PATH):
+        self.words = np.load(os.path.join(path, "words.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.synonyms = np.load(os.path.join(path, "synonyms.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.words)
+
+    def _position(self, word):
+        key = word.lower().encode("ascii", "ignore")
+        i = int(np.searchsorted(self.words, key))
+        if i < len(self.words) and self.words[i] == key:
+            return i
+        return None
+
+    def count(self, word):
+        i = self._position(word)
+        return 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+
+    def lookup(self, word):
+        i = self._position(word)
+        if i is None:
+            return []
+        return [self.words[j].decode("ascii") for j in self.synonyms[self.offsets[i]:self.offsets[i + 1]]]
+
+    def choice(self, word, rng):
+        # One random synonym without materialising the whole list, or None if the word has none
+        i = self._position(word)
+        if i is None or self.offsets[i + 1] == self.offsets[i]:
+            return None
+        j = self.synonyms[rng.integers(self.offsets[i], self.offsets[i + 1])]
+        return self.words[j].decode("ascii")
+
+
+def load_synonym_index(path=INDEX_PATH):
+    # Memory-maps the saved index, building it from WordNet on first use
+    if os.path.exists(os.path.join(path, "synonyms.npy")):
+        return SynonymIndex(path)
+    return build_synonym_index(path=path)
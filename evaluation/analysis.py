@@ -1,30 +1,119 @@
-from sentence_transformers import SentenceTransformer, util
+import os
+from itertools import islice
+
+import numpy as np
 import pandas as pd
-from Levenshtein import distance as levenshtein_distance
-from textstat import flesch_reading_ease
+from rapidfuzz.distance import Levenshtein
+from rapidfuzz.process import cpdist
 
+from evaluation import instrumentation
+from evaluation.embedding_store import STORE_PATH, EmbeddingStore
+from evaluation.readability import readability_scores
+from models import registry
 
-model = SentenceTransformer("all-mpnet-base-v2")
 
-def compute_similarity(clean_texts, perturbed_texts):
+SENTENCE_MODEL = "all-mpnet-base-v2"
 
-    clean_emb = model.encode(clean_texts, convert_to_tensor=True, show_progress_bar=True)
-    pert_emb = model.encode(perturbed_texts, convert_to_tensor=True, show_progress_bar=True)
 
-    sims = util.cos_sim(clean_emb, pert_emb)
-    diagonal_sims = [float(sims[i][i]) for i in range(len(clean_texts))]
+def _load_sentence_transformer():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(SENTENCE_MODEL)
 
-    return pd.DataFrame({
-        "clean": clean_texts,
-        "perturbed": perturbed_texts,
-        "similarity": diagonal_sims
-    })
+
+def _load_embedding_store():
+    # Set EMBEDDING_STORE_PATH to an empty string to always encode from scratch
+    if not STORE_PATH:
+        return None
+    return EmbeddingStore(os.path.join(STORE_PATH, SENTENCE_MODEL))
+
+
+registry.register("sentence_transformer", _load_sentence_transformer)
+registry.register("embedding_store", _load_embedding_store)
+
+SIMILARITY_CHUNK_SIZE = 4096
+
+def _encode_with_model(texts, batch_size=64):
+    model = registry.get("sentence_transformer")
+    with instrumentation.timer("model/sentence_transformer"):
+        return model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True,
+                            show_progress_bar=False)
+
+
+def encode_texts(texts):
+    # Unit-length embeddings, so the cosine similarity of two rows is just their dot product. Texts already in
+    # the embedding store are read from it and only the rest are encoded (and then stored); the model itself is
+    # not even loaded when every text is a hit
+    store = registry.get("embedding_store")
+    if store is None:
+        return _encode_with_model(texts)
+    return store.encode(texts, _encode_with_model)
+
+
+def paired_cosine(a, b):
+    # Row-wise cosine similarity of two equally long stacks of normalised embeddings: O(N) instead of the N x N
+    # matrix that util.cos_sim would build
+    return np.einsum("ij,ij->i", a, b).astype(np.float64)
+
+
+def iter_similarity_batch(clean_texts, perturbed, chunk_size=SIMILARITY_CHUNK_SIZE):
+    # Streams {condition: frame} for consecutive chunks of rows. Each chunk of clean texts is encoded once and
+    # compared against every perturbed condition, and only one chunk of embeddings is held at a time, so inputs
+    # can be arbitrarily large iterables. Frames are indexed by global row position. Columns of different lengths
+    # raise ValueError, up front for sized inputs and otherwise once the shortest one runs out
+    names = list(perturbed)
+    if hasattr(clean_texts, "__len__"):
+        for name in names:
+            column = perturbed[name]
+            if hasattr(column, "__len__") and len(column) != len(clean_texts):
+                raise ValueError(f"'{name}' has {len(column)} texts but there are {len(clean_texts)} clean texts")
+    rows = zip(clean_texts, *(perturbed[name] for name in names), strict=True)
+    offset = 0
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        columns = list(zip(*chunk))
+        clean_emb = encode_texts(columns[0])
+        index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+
+        frames = {}
+        for name, column in zip(names, columns[1:]):
+            frames[name] = pd.DataFrame({
+                "clean": list(columns[0]),
+                "perturbed": list(column),
+                "similarity": paired_cosine(clean_emb, encode_texts(column)),
+            }, index=index)
+        yield frames
+
+
+def iter_similarity(clean_texts, perturbed_texts, chunk_size=SIMILARITY_CHUNK_SIZE):
+    for frames in iter_similarity_batch(clean_texts, {"perturbed": perturbed_texts}, chunk_size):
+        yield frames["perturbed"]
+
+
+def compute_similarity_batch(clean_texts, perturbed, chunk_size=SIMILARITY_CHUNK_SIZE):
+    results = {name: [] for name in perturbed}
+    for frames in iter_similarity_batch(clean_texts, perturbed, chunk_size):
+        for name, frame in frames.items():
+            results[name].append(frame)
+
+    empty = pd.DataFrame({"clean": [], "perturbed": [], "similarity": []})
+    return {name: pd.concat(frames) if frames else empty for name, frames in results.items()}
+
+
+def compute_similarity(clean_texts, perturbed_texts, chunk_size=SIMILARITY_CHUNK_SIZE):
+    return compute_similarity_batch(clean_texts, {"perturbed": perturbed_texts}, chunk_size)["perturbed"]
 
 
 def compare_similarity(clean, human, auto):
-    
-    human_df = compute_similarity(clean, human)
-    auto_df = compute_similarity(clean, auto)
+
+    # The clean texts are encoded once and shared by both conditions
+    results = compute_similarity_batch(clean, {"human": human, "automated": auto})
+    human_df = results["human"]
+    auto_df = results["automated"]
 
     summary = pd.DataFrame({
         "type": ["human", "automated"],
@@ -48,17 +137,46 @@ def compare_similarity(clean, human, auto):
 
     return human_df, auto_df, summary
 
-def compute_levenshtein(clean_texts, perturbed_texts):
-    distances = [
-        levenshtein_distance(clean_texts[i], perturbed_texts[i])
-        for i in range(len(clean_texts))
-    ]
+def _as_text(texts):
+    return [t if isinstance(t, str) else "" for t in texts]
 
-    return pd.DataFrame({
-        "clean": clean_texts,
-        "perturbed": perturbed_texts,
-        "lev_distance": distances
-    })
+
+def compute_levenshtein(clean_texts, perturbed_texts, workers=-1):
+    return compute_levenshtein_batch(clean_texts, {"perturbed": perturbed_texts}, workers=workers)["perturbed"]
+
+
+def compute_levenshtein_batch(clean_texts, perturbed, workers=-1):
+    # Distances for several perturbed columns against the same clean column in one rapidfuzz call: the clean
+    # column is repeated once per perturbed column and every pair is scored in C across `workers` threads
+    # (-1 uses every core). Normalised distance is the edit distance divided by the longer text's length,
+    # the same as rapidfuzz's Levenshtein.normalized_distance
+    clean_texts = list(clean_texts)
+    names = list(perturbed)
+    columns = [list(perturbed[name]) for name in names]
+    for name, column in zip(names, columns):
+        if len(column) != len(clean_texts):
+            raise ValueError(f"'{name}' has {len(column)} texts but there are {len(clean_texts)} clean texts")
+
+    references = _as_text(clean_texts) * len(columns)
+    candidates = _as_text(t for column in columns for t in column)
+
+    distances = cpdist(references, candidates, scorer=Levenshtein.distance, workers=workers, dtype=np.int64)
+    longest = np.maximum(np.fromiter(map(len, references), dtype=np.int64, count=len(references)),
+                         np.fromiter(map(len, candidates), dtype=np.int64, count=len(candidates)))
+    normalised = np.divide(distances, longest, out=np.zeros(len(distances)), where=longest > 0)
+
+    results = {}
+    n = len(clean_texts)
+    for i, (name, column) in enumerate(zip(names, columns)):
+        part = slice(i * n, (i + 1) * n)
+        results[name] = pd.DataFrame({
+            "clean": clean_texts,
+            "perturbed": column,
+            "lev_distance": distances[part],
+            "lev_normalised": normalised[part],
+            "lev_similarity": 1 - normalised[part],
+        })
+    return results
 
 
 def summarise_levenshtein(df, label):
@@ -70,18 +188,18 @@ def summarise_levenshtein(df, label):
         "max": df["lev_distance"].max()
     }
 
-def compute_readability(clean_texts, perturbed_texts):
-    clean_flesch = [flesch_reading_ease(t if isinstance(t, str) else "") for t in clean_texts]
-    pert_flesch = [flesch_reading_ease(t if isinstance(t, str) else "") for t in perturbed_texts]
-    flesch_change = [pert_flesch[i] - clean_flesch[i] for i in range(len(clean_flesch))]
-
-    return pd.DataFrame({
-        "clean": clean_texts,
-        "perturbed": perturbed_texts,
-        "flesch_clean": clean_flesch,
-        "flesch_perturbed": pert_flesch,
-        "flesch_change": flesch_change
-    })
+def compute_readability(clean_texts, perturbed_texts, clean_scores=None, workers=None):
+    # Readability of both sides and the change per text for each index. Pass the readability_scores of the
+    # clean texts as clean_scores to reuse them across several perturbed conditions
+    clean_scores = clean_scores if clean_scores is not None else readability_scores(clean_texts, workers)
+    pert_scores = readability_scores(perturbed_texts, workers)
+
+    df = pd.DataFrame({"clean": clean_texts, "perturbed": perturbed_texts})
+    for index in pert_scores.columns:
+        df[f"{index}_clean"] = clean_scores[index].to_numpy()
+        df[f"{index}_perturbed"] = pert_scores[index].to_numpy()
+        df[f"{index}_change"] = df[f"{index}_perturbed"] - df[f"{index}_clean"]
+    return df
 
 
 def summarise_readability(df, label):
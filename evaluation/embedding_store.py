@@ -0,0 +1,195 @@
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+# Persistent embedding store for one model. Vectors live in a flat binary matrix that readers memory-map, and
+# the SHA-256 of each row's text lives in a parallel keys file. meta.json records how many rows are committed,
+# so readers never look past rows a writer is still appending. Appends and compaction hold an exclusive file
+# lock; readers take no lock at all. Files are versioned by a generation number so that compaction can write a
+# new copy and switch to it atomically while existing readers keep using their old memory map.
+#
+#   meta.json           {"dim", "dtype", "rows", "generation"}
+#   keys-<gen>.bin      rows x 32-byte digests
+#   vectors-<gen>.bin   rows x dim values of dtype
+
+STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", ".embedding_store")
+STORE_DTYPE = os.getenv("EMBEDDING_STORE_DTYPE", "float32")
+_KEY_SIZE = 32
+
+
+def text_digest(text):
+    return hashlib.sha256(str(text).encode("utf-8", "surrogatepass")).digest()
+
+
+class EmbeddingStore:
+
+    def __init__(self, path, dtype=STORE_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        self._index = {}
+        self._rows = 0
+        self._generation = None
+        self._vectors = np.empty((0, 0), dtype=self.dtype)
+        os.makedirs(path, exist_ok=True)
+        self.refresh()
+
+    def _file(self, kind, generation):
+        return os.path.join(self.path, f"{kind}-{generation}.bin")
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.path, "meta.json")) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_meta(self, meta):
+        tmp_path = os.path.join(self.path, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    @contextmanager
+    def _locked(self):
+        with open(os.path.join(self.path, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def refresh(self):
+        # Picks up rows committed by other processes since the last refresh, or reloads after a compaction.
+        # A compaction may remove the files of the generation just read from meta.json, in which case retry
+        for _ in range(5):
+            try:
+                self._refresh()
+                return
+            except FileNotFoundError:
+                continue
+        self._refresh()
+
+    def _refresh(self):
+        meta = self._read_meta()
+        if meta is None:
+            return
+
+        if np.dtype(meta["dtype"]) != self.dtype:
+            raise ValueError(f"Store at {self.path} holds {meta['dtype']} vectors, not {self.dtype}")
+
+        if meta["generation"] != self._generation:
+            self._index, self._rows, self._generation = {}, 0, meta["generation"]
+        self.dim = meta["dim"]
+
+        rows = meta["rows"]
+        if rows > self._rows:
+            with open(self._file("keys", self._generation), "rb") as f:
+                f.seek(self._rows * _KEY_SIZE)
+                data = f.read((rows - self._rows) * _KEY_SIZE)
+            for i in range(rows - self._rows):
+                self._index[data[i * _KEY_SIZE:(i + 1) * _KEY_SIZE]] = self._rows + i
+            self._rows = rows
+
+        if rows:
+            self._vectors = np.memmap(self._file("vectors", self._generation), dtype=self.dtype, mode="r",
+                                      shape=(rows, self.dim))
+        else:
+            self._vectors = np.empty((0, self.dim or 0), dtype=self.dtype)
+
+    def __len__(self):
+        return self._rows
+
+    def __contains__(self, text):
+        return text_digest(text) in self._index
+
+    def append(self, digests, vectors):
+        vectors = np.asarray(vectors)
+        with self._locked():
+            self.refresh()
+            meta = self._read_meta() or {"dim": vectors.shape[1], "dtype": self.dtype.name, "rows": 0, "generation": 0}
+            if vectors.shape[1] != meta["dim"]:
+                raise ValueError(f"Store at {self.path} holds {meta['dim']}-d vectors, got {vectors.shape[1]}-d")
+
+            # Another process may have stored some of these in the meantime
+            fresh = {}
+            for digest, vector in zip(digests, vectors):
+                if digest not in self._index and digest not in fresh:
+                    fresh[digest] = vector
+            if not fresh:
+                return
+
+            rows = meta["rows"]
+            row_bytes = meta["dim"] * self.dtype.itemsize
+            block = np.stack(list(fresh.values())).astype(self.dtype)
+
+            # Anything past the committed rows is left over from a writer that crashed before updating meta.json
+            for kind, offset, payload in (("keys", rows * _KEY_SIZE, b"".join(fresh)),
+                                          ("vectors", rows * row_bytes, block.tobytes())):
+                path = self._file(kind, meta["generation"])
+                with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+                    f.truncate(offset)
+                    f.seek(offset)
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            meta["rows"] = rows + len(fresh)
+            self._write_meta(meta)
+            self.refresh()
+
+    def get(self, texts):
+        # Stored vectors as float32, one row per text; raises KeyError for a text that is not stored
+        rows = [self._index[text_digest(t)] for t in texts]
+        return np.asarray(self._vectors[rows], dtype=np.float32)
+
+    def encode(self, texts, encode_fn, batch_size=1024):
+        # Returns one vector per text, calling encode_fn only for distinct texts that are not stored yet.
+        # New vectors are appended in batches of batch_size so partial progress survives an interruption
+        texts = list(texts)
+        self.refresh()
+
+        missing = list(dict.fromkeys(t for t in texts if text_digest(t) not in self._index))
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            self.append([text_digest(t) for t in batch], encode_fn(batch))
+
+        return self.get(texts)
+
+    def compact(self, keep=None):
+        # Rewrites the store as a new generation holding only the texts in keep (all rows if keep is None),
+        # then switches readers over by rewriting meta.json. Old files are removed once nothing new can open them
+        with self._locked():
+            self.refresh()
+            meta = self._read_meta()
+            if meta is None:
+                return 0
+
+            if keep is None:
+                digests = sorted(self._index, key=self._index.get)
+            else:
+                digests = [d for d in dict.fromkeys(text_digest(t) for t in keep) if d in self._index]
+
+            old_generation = meta["generation"]
+            generation = old_generation + 1
+            rows = [self._index[d] for d in digests]
+            with open(self._file("keys", generation), "wb") as f:
+                f.write(b"".join(digests))
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._file("vectors", generation), "wb") as f:
+                f.write(np.ascontiguousarray(self._vectors[rows]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._write_meta({**meta, "rows": len(digests), "generation": generation})
+            for kind in ("keys", "vectors"):
+                os.remove(self._file(kind, old_generation))
+            self.refresh()
+            return len(digests)
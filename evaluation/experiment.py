@@ -0,0 +1,163 @@
+import os
+import pickle
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from evaluation import instrumentation
+
+# Small DAG engine for experiments. Every node is a function of the results of the nodes it depends on. Nodes
+# run as soon as their dependencies are done, each on a lane: a lane is a thread pool for one contended resource
+# (the CPU for local inference, the rate-limited Perspective quota, ...) with its own concurrency limit, so work
+# on different resources overlaps while work on the same one does not oversubscribe it.
+#
+# With a checkpoint directory every finished node's result is pickled there, written to a temporary file and
+# renamed into place, and a later run loads it instead of running the node again. An interrupted run therefore
+# resumes with the nodes that had not finished.
+
+DEFAULT_LANES = {"cpu": 1}
+
+
+class Node:
+
+    def __init__(self, name, func, deps=(), lane="cpu"):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.lane = lane
+
+
+class Experiment:
+
+    def __init__(self, checkpoint_dir=None, lanes=None, verbose=True):
+        self.nodes = {}
+        self.checkpoint_dir = checkpoint_dir
+        self.lanes = {**DEFAULT_LANES, **(lanes or {})}
+        self.verbose = verbose
+        self._results = {}
+        if checkpoint_dir:
+            os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def add(self, name, func, deps=(), lane="cpu"):
+        if name in self.nodes:
+            raise ValueError(f"Node '{name}' is already defined")
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown lane '{lane}' for node '{name}'; lanes are {sorted(self.lanes)}")
+        self.nodes[name] = Node(name, func, deps, lane)
+        return name
+
+    def const(self, name, value):
+        # A node whose result is given rather than computed; it is never checkpointed
+        self.add(name, lambda: value)
+        self._results[name] = value
+        return name
+
+    def _checkpoint(self, name):
+        return os.path.join(self.checkpoint_dir, name.replace("/", "__") + ".pkl")
+
+    def _has_checkpoint(self, name):
+        return bool(self.checkpoint_dir) and os.path.exists(self._checkpoint(name))
+
+    def _save(self, name, result):
+        path = self._checkpoint(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def result(self, name):
+        if name not in self._results:
+            with open(self._checkpoint(name), "rb") as f:
+                self._results[name] = pickle.load(f)
+        return self._results[name]
+
+    def _required(self, targets):
+        # Every node the targets depend on, checking for unknown names and cycles on the way
+        order, state = [], {}
+
+        def visit(name, path):
+            if name not in self.nodes:
+                raise KeyError(f"Unknown node '{name}'" + (f" required by '{path[-1]}'" if path else ""))
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError("Dependency cycle: " + " -> ".join([*path, name]))
+            state[name] = "visiting"
+            for dep in self.nodes[name].deps:
+                visit(dep, [*path, name])
+            state[name] = "done"
+            order.append(name)
+
+        for target in targets:
+            visit(target, [])
+        return order
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def run(self, targets=None):
+        # Runs everything needed for targets (all nodes if None) and returns {target: result}. If a node fails,
+        # nodes already running are allowed to finish and checkpoint, nothing new is started, and the error is
+        # raised
+        targets = list(self.nodes) if targets is None else list(targets)
+        pending = []
+        for name in self._required(targets):
+            if name in self._results:
+                continue
+            if self._has_checkpoint(name):
+                self._log(f"[resume] {name}")
+            else:
+                pending.append(name)
+
+        waiting = {name: {d for d in self.nodes[name].deps if d in pending} for name in pending}
+        dependents = {}
+        for name, deps in waiting.items():
+            for dep in deps:
+                dependents.setdefault(dep, []).append(name)
+
+        executors = {lane: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"experiment-{lane}")
+                     for lane, workers in self.lanes.items()}
+        running = {}
+        error = None
+
+        def submit(name):
+            node = self.nodes[name]
+            self._log(f"[start] {name}")
+            running[executors[node.lane].submit(self._execute, node)] = name
+
+        try:
+            for name in [n for n, deps in waiting.items() if not deps]:
+                submit(name)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self._results[name], elapsed = future.result()
+                    except Exception as e:
+                        error = error or e
+                        self._log(f"[failed] {name}: {e}")
+                        continue
+
+                    self._log(f"[done] {name} in {elapsed:.1f}s")
+                    if error is None:
+                        for dependent in dependents.get(name, []):
+                            waiting[dependent].discard(name)
+                            if not waiting[dependent]:
+                                submit(dependent)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+        if error is not None:
+            raise error
+        return {name: self.result(name) for name in targets}
+
+    def _execute(self, node):
+        start = time.perf_counter()
+        with instrumentation.stage(node.name):
+            result = node.func(*(self.result(dep) for dep in node.deps))
+        if self.checkpoint_dir:
+            self._save(node.name, result)
+        return result, time.perf_counter() - start
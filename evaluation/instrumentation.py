@@ -0,0 +1,293 @@
+import contextlib
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Instrumentation for pipeline runs: timers around stages and model calls, counters (texts processed, cache hits,
+# API calls), peak RSS and optionally tracemalloc snapshots and a cProfile capture per stage. The collected
+# numbers are exported as a JSON run report and in the Prometheus text exposition format.
+#
+# It is off until enable() is called, or INSTRUMENTATION=1 is set in the environment. While off, timer() and
+# stage() hand back one shared no-op context manager, count() returns straight away and @timed functions call
+# through, so the calls left in hot paths cost no more than a function call and a check for None.
+#
+#   with stage("load_dataset"):           time, peak RSS, tracemalloc snapshot and cProfile capture of a stage
+#   with timer("model/detoxify"):         time only, aggregated over calls; cheap enough for every batch
+#   @timed("model/detoxify")              the same as a decorator
+#   count("cache_hits", 12, model=...)    a counter, with labels
+
+METRIC_PREFIX = "toxicity_pipeline"
+PROFILE_TOP = 30
+TRACEMALLOC_TOP = 10
+
+_DISABLED = contextlib.nullcontext()
+_recorder = None
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process so far, or None where the resource module is unavailable
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+class Recorder:
+
+    def __init__(self, profile=False, trace_memory=False, profile_dir=None):
+        self.started = time.time()
+        self.profile = profile or bool(profile_dir)
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.timers = {}
+        self.stages = []
+        self.counters = Counter()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        # cProfile can only have one profiler active at a time on newer Pythons, so stages that overlap (on
+        # different experiment lanes, or nested) are profiled one at a time and the others are only timed
+        self._profile_lock = threading.Lock()
+        self._started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            calls, total, longest = self.timers.get(name, (0, 0.0, 0.0))
+            self.timers[name] = (calls + 1, total + seconds, max(longest, seconds))
+
+    def add_count(self, name, n, labels):
+        with self._lock:
+            self.counters[name, tuple(sorted(labels.items()))] += n
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def _start_profile(self):
+        if not self.profile or not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (a debugger, or cProfile run from the command line) is already active
+            self._profile_lock.release()
+            return None
+        return profiler
+
+    def _profile_summary(self, profiler, name):
+        if self.profile_dir:
+            profiler.dump_stats(os.path.join(self.profile_dir, re.sub(r"[^\w.-]", "_", name) + ".prof"))
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        return out.getvalue()
+
+    def _memory_snapshot(self):
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        top = [{"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                "size_mb": stat.size / 2 ** 20, "count": stat.count}
+               for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]]
+        return {"current_mb": current / 2 ** 20, "peak_mb": peak / 2 ** 20, "top": top}
+
+    @contextlib.contextmanager
+    def stage(self, name, profile=True):
+        # The tracemalloc peak is reset when a stage starts, so with stages running concurrently it covers
+        # everything allocated while this one ran, not just this stage's own allocations
+        profiler = self._start_profile() if profile else None
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        offset = time.perf_counter() - self._start
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            seconds = time.perf_counter() - start
+            record = {"name": name, "start_s": offset, "seconds": seconds, "failed": failed,
+                      "peak_rss_mb": peak_rss_mb()}
+            if profiler is not None:
+                profiler.disable()
+                self._profile_lock.release()
+            # Taken before the profile is summarised, so the snapshot does not list pstats' own allocations
+            if self.trace_memory:
+                record["tracemalloc"] = self._memory_snapshot()
+            if profiler is not None:
+                record["profile"] = self._profile_summary(profiler, name)
+            self.add_time(f"stage/{name}", seconds)
+            with self._lock:
+                self.stages.append(record)
+
+    def report(self):
+        with self._lock:
+            timers = dict(self.timers)
+            counters = dict(self.counters)
+            stages = list(self.stages)
+
+        report = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+            "wall_seconds": time.perf_counter() - self._start,
+            "peak_rss_mb": peak_rss_mb(),
+            "timers": {name: {"calls": calls, "total_s": total, "mean_s": total / calls, "max_s": longest}
+                       for name, (calls, total, longest) in sorted(timers.items())},
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(counters.items())],
+            "stages": stages,
+        }
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {"current_mb": current / 2 ** 20, "peak_mb": peak / 2 ** 20}
+        return report
+
+    def close(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+
+def enable(profile=False, trace_memory=False, profile_dir=None):
+    # Starts collecting into a fresh recorder and returns it. profile captures cProfile statistics per stage
+    # (also saved as .prof files if profile_dir is given); trace_memory starts tracemalloc, which slows Python
+    # code down noticeably
+    global _recorder
+    disable()
+    _recorder = Recorder(profile, trace_memory, profile_dir)
+    return _recorder
+
+
+def disable():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+
+
+def enabled():
+    return _recorder is not None
+
+
+def timer(name):
+    recorder = _recorder
+    return _DISABLED if recorder is None else recorder.timer(name)
+
+
+def stage(name, profile=True):
+    # profile=False for stages that only wrap other stages, so that the inner ones get the profiler
+    recorder = _recorder
+    return _DISABLED if recorder is None else recorder.stage(name, profile)
+
+
+def timed(name=None):
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder
+            if recorder is None:
+                return func(*args, **kwargs)
+            with recorder.timer(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1, **labels):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.add_count(name, n, labels)
+
+
+def report():
+    return _recorder.report() if _recorder is not None else None
+
+
+def _metric_name(name):
+    return f"{METRIC_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escape = lambda value: str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def prometheus_text(run_report):
+    # The run report in the Prometheus text exposition format, for a node_exporter textfile collector or a
+    # Pushgateway
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        name = _metric_name(name)
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+    timers = run_report["timers"]
+    metric("timer_seconds_total", "counter", "Time spent in each timed section.",
+           [({"name": name}, t["total_s"]) for name, t in timers.items()])
+    metric("timer_calls_total", "counter", "Calls of each timed section.",
+           [({"name": name}, t["calls"]) for name, t in timers.items()])
+    metric("timer_max_seconds", "gauge", "Longest single call of each timed section.",
+           [({"name": name}, t["max_s"]) for name, t in timers.items()])
+
+    counters = {}
+    for c in run_report["counters"]:
+        counters.setdefault(c["name"], []).append((c["labels"], c["value"]))
+    for name, samples in counters.items():
+        metric(f"{name}_total", "counter", f"Count of {name.replace('_', ' ')}.", samples)
+
+    metric("wall_seconds", "gauge", "Wall-clock duration of the run.", [({}, run_report["wall_seconds"])])
+    if run_report["peak_rss_mb"] is not None:
+        metric("peak_rss_bytes", "gauge", "Peak resident set size of the process.",
+               [({}, int(run_report["peak_rss_mb"] * 2 ** 20))])
+    if "tracemalloc" in run_report:
+        metric("tracemalloc_peak_bytes", "gauge", "Peak memory traced by tracemalloc.",
+               [({}, int(run_report["tracemalloc"]["peak_mb"] * 2 ** 20))])
+    return "\n".join(lines) + "\n"
+
+
+def _write(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_report(path):
+    # Writes the JSON run report to path and the Prometheus metrics next to it (same name, .prom); returns the
+    # report, or None if instrumentation is off
+    run_report = report()
+    if run_report is None:
+        return None
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    _write(path, json.dumps(run_report, indent=2))
+    _write(os.path.splitext(path)[0] + ".prom", prometheus_text(run_report))
+    return run_report
+
+
+if os.getenv("INSTRUMENTATION", "") not in ("", "0"):
+    enable(profile=os.getenv("INSTRUMENTATION_PROFILE", "") not in ("", "0"),
+           trace_memory=os.getenv("INSTRUMENTATION_TRACEMALLOC", "") not in ("", "0"))
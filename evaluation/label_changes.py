@@ -1,34 +1,55 @@
+import numpy as np
 import pandas as pd
 
 TOXIC_LABELS = {"offensive", "hate_speech"}
 NORMAL_LABEL = "normal"
 
-def evaluate_label_changes(clean_labels, perturbed_labels):
+# Integer codes of the HateXplain labels, by position in LABELS. Anything else (None from a failed call, say) is
+# coded -1 and counts as neither normal nor toxic
+LABELS = ("normal", "offensive", "hate_speech")
+NORMAL_CODE = LABELS.index(NORMAL_LABEL)
+TOXIC_CODES = sorted(LABELS.index(label) for label in TOXIC_LABELS)
 
-    assert len(clean_labels) == len(perturbed_labels)
 
-    normal_to_toxic = 0
-    toxic_to_normal = 0
-    total_normal = 0
-    total_toxic = 0
+def encode_labels(labels):
+    return pd.Categorical(np.asarray(labels, dtype=object), categories=LABELS).codes
+
 
-    for c, p in zip(clean_labels, perturbed_labels):
+def flip_indicators(clean_codes, perturbed_codes):
+    # Boolean arrays (clean normal, clean toxic, normal -> toxic, toxic -> normal) for integer-coded labels. The
+    # perturbed codes can be a (conditions, rows) matrix, and the clean codes then broadcast across its rows
+    clean_codes = np.broadcast_to(clean_codes, np.shape(perturbed_codes))
+    normal = clean_codes == NORMAL_CODE
+    toxic = np.isin(clean_codes, TOXIC_CODES)
+    return (normal, toxic, normal & np.isin(perturbed_codes, TOXIC_CODES), toxic & (perturbed_codes == NORMAL_CODE))
+
+
+def evaluate_label_changes(clean_labels, perturbed_labels):
 
-        if c == NORMAL_LABEL:
-            total_normal += 1
-            if p in TOXIC_LABELS:
-                normal_to_toxic += 1
+    assert len(clean_labels) == len(perturbed_labels)
 
-        if c in TOXIC_LABELS:
-            total_toxic += 1
-            if p == NORMAL_LABEL:
-                toxic_to_normal += 1
+    normal, toxic, normal_to_toxic, toxic_to_normal = (
+        int(flags.sum()) for flags in flip_indicators(encode_labels(clean_labels), encode_labels(perturbed_labels)))
 
     return pd.DataFrame([{
-        "normal_to_toxic_rate": normal_to_toxic / total_normal if total_normal else 0,
-        "toxic_to_normal_rate": toxic_to_normal / total_toxic if total_toxic else 0,
+        "normal_to_toxic_rate": normal_to_toxic / normal if normal else 0,
+        "toxic_to_normal_rate": toxic_to_normal / toxic if toxic else 0,
         "normal_to_toxic_count": normal_to_toxic,
         "toxic_to_normal_count": toxic_to_normal,
-        "total_normal": total_normal,
-        "total_toxic": total_toxic
+        "total_normal": normal,
+        "total_toxic": toxic
+    }])
+
+
+def merge_label_changes(frames):
+    # Combines the tables of disjoint sets of texts into the table of all of them: the counts add up and the
+    # rates are recomputed from the summed counts, so the result equals evaluate_label_changes on the union
+    counts = pd.concat(frames)[["normal_to_toxic_count", "toxic_to_normal_count", "total_normal", "total_toxic"]]
+    totals = {k: int(v) for k, v in counts.sum().items()}
+    total_normal, total_toxic = totals["total_normal"], totals["total_toxic"]
+
+    return pd.DataFrame([{
+        "normal_to_toxic_rate": totals["normal_to_toxic_count"] / total_normal if total_normal else 0,
+        "toxic_to_normal_rate": totals["toxic_to_normal_count"] / total_toxic if total_toxic else 0,
+        **totals
     }])
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from models.cache import cached_scores
+
+# Readability engine. The textstat counts every index is built from (words, sentences, syllables and Dale-Chall
+# difficult words) are computed once per distinct text and kept in the score cache, and the indices are then
+# evaluated for all texts at once from those counts with the same arithmetic textstat uses, so they come out
+# exactly equal to textstat's own flesch_reading_ease, flesch_kincaid_grade and dale_chall_readability_score.
+
+STATS = ("words", "sentences", "syllables", "difficult_words")
+
+# Below this many uncached texts the counts are computed in this process, as starting a pool costs more
+PARALLEL_MIN_TEXTS = 5000
+PARALLEL_CHUNK_SIZE = 1000
+
+# English coefficients, as in textstat's en_US configuration
+FRE_BASE = 206.835
+FRE_SENTENCE_LENGTH = 1.015
+FRE_SYLLABLES_PER_WORD = 84.6
+
+
+def _cache_id():
+    from importlib.metadata import version
+    return f"readability:textstat-{version('textstat')}"
+
+
+def _text_stats(text):
+    import textstat
+
+    text = text if isinstance(text, str) else ""
+    return [
+        textstat.lexicon_count(text),
+        textstat.sentence_count(text),
+        textstat.syllable_count(text),
+        textstat.difficult_words(text, syllable_threshold=0, unique=False),
+    ]
+
+
+def _stats_chunk(chunk):
+    return [_text_stats(t) for t in chunk]
+
+
+def _compute_stats(texts, workers=None):
+    if len(texts) < PARALLEL_MIN_TEXTS or workers == 1:
+        return _stats_chunk(texts)
+
+    from mitigations.parallel import parallel_map
+    jobs = [texts[i:i + PARALLEL_CHUNK_SIZE] for i in range(0, len(texts), PARALLEL_CHUNK_SIZE)]
+    return parallel_map(_stats_chunk, jobs, workers)
+
+
+def text_stats(texts, workers=None):
+    # (N, 4) int64 array of STATS, one row per text. Texts that are neither cached nor repeated earlier in the
+    # batch are counted, across a process pool when there are many of them
+    texts = [t if isinstance(t, str) else "" for t in texts]
+    rows = cached_scores(_cache_id(), texts, lambda missing: _compute_stats(missing, workers))
+    return np.array(rows, dtype=np.int64).reshape(len(texts), len(STATS))
+
+
+def readability_indices(stats):
+    # Flesch reading ease, Flesch-Kincaid grade and Dale-Chall score for every row of a text_stats array.
+    # Each formula mirrors textstat's, including returning 0.0 where textstat would divide by zero
+    stats = np.asarray(stats, dtype=np.int64).reshape(-1, len(STATS))
+    words, sentences, syllables, difficult = (stats[:, i].astype(np.float64) for i in range(len(STATS)))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sentence_length = np.where(sentences > 0, words / sentences, 0.0)
+        syllables_per_word = np.where(words > 0, syllables / words, 0.0)
+        percent_difficult = np.where(words > 0, 100 * difficult / words, 0.0)
+
+    defined = (sentence_length != 0) & (syllables_per_word != 0)
+    flesch = np.where(defined, FRE_BASE - FRE_SENTENCE_LENGTH * sentence_length
+                      - FRE_SYLLABLES_PER_WORD * syllables_per_word, 0.0)
+    fk_grade = np.where(defined, (0.39 * sentence_length) + (11.8 * syllables_per_word) - 15.59, 0.0)
+
+    dale_chall = (0.1579 * percent_difficult) + (0.0496 * sentence_length)
+    dale_chall = np.where(percent_difficult > 5, dale_chall + 3.6365, dale_chall)
+    dale_chall = np.where(words > 0, dale_chall, 0.0)
+
+    return pd.DataFrame({"flesch": flesch, "fk_grade": fk_grade, "dale_chall": dale_chall})
+
+
+def readability_scores(texts, workers=None):
+    return readability_indices(text_stats(texts, workers))
@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+
+import pandas as pd
+
+# On-disk layout of a sharded run. Every shard evaluates a contiguous range of rows and writes its raw,
+# per-row outputs as one Parquet file per table, plus meta.json describing the run, into
+#
+#   <output_dir>/shards/<index>-of-<count>/
+#
+# The directory is written under a temporary name and renamed into place once complete, so a shard directory
+# that exists is always whole. Merging concatenates the tables of all shards in row order, which gives exactly
+# the tables a single unsharded run would have produced. While a shard runs, its experiment checkpoints live in
+# <output_dir>/checkpoints/<index>-of-<count>/ so that an interrupted shard can resume.
+
+SHARD_DIR = "shards"
+CHECKPOINT_DIR = "checkpoints"
+
+
+def shard_bounds(n_rows, shard_index, num_shards):
+    # Contiguous [start, stop) row range of one shard; sizes differ by at most one row
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(f"Shard index {shard_index} is out of range for {num_shards} shards")
+    return n_rows * shard_index // num_shards, n_rows * (shard_index + 1) // num_shards
+
+
+def shard_path(output_dir, shard_index, num_shards):
+    return os.path.join(output_dir, SHARD_DIR, f"{shard_index:05d}-of-{num_shards:05d}")
+
+
+def checkpoint_path(output_dir, shard_index, num_shards, meta, resume=True):
+    # Checkpoint directory for one shard. Checkpoints left by a run with different settings (or all of them,
+    # with resume=False) are discarded first, since they would not match what this run computes
+    path = os.path.join(output_dir, CHECKPOINT_DIR, f"{shard_index:05d}-of-{num_shards:05d}")
+    meta_path = os.path.join(path, "meta.json")
+
+    previous = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            previous = json.load(f)
+    if os.path.isdir(path) and (not resume or previous != meta):
+        shutil.rmtree(path)
+
+    if not os.path.exists(meta_path):
+        os.makedirs(path)
+        with open(meta_path, "w") as f:
+            json.dump(meta, f)
+    return path
+
+
+def write_shard(output_dir, shard_index, num_shards, tables, meta):
+    path = shard_path(output_dir, shard_index, num_shards)
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name, frame in tables.items():
+        frame.to_parquet(os.path.join(tmp_path, f"{name}.parquet"), index=False)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({**meta, "shard_index": shard_index, "num_shards": num_shards, "tables": list(tables)}, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_shards(output_dir):
+    # Returns (meta, tables) with every table concatenated across shards in row order. All shards of the run
+    # must be present and must agree on everything in meta.json other than their own index and row range
+    root = os.path.join(output_dir, SHARD_DIR)
+    names = sorted(n for n in os.listdir(root) if not n.startswith(".")) if os.path.isdir(root) else []
+    if not names:
+        raise FileNotFoundError(f"No shards found in {root}")
+
+    metas = []
+    for name in names:
+        with open(os.path.join(root, name, "meta.json")) as f:
+            metas.append(json.load(f))
+
+    per_shard = ("shard_index", "start", "stop")
+    run = {k: v for k, v in metas[0].items() if k not in per_shard}
+    for meta in metas:
+        if {k: v for k, v in meta.items() if k not in per_shard} != run:
+            raise ValueError(f"Shard {meta['shard_index']} was written by a different run than shard "
+                             f"{metas[0]['shard_index']}")
+
+    found = sorted(meta["shard_index"] for meta in metas)
+    if found != list(range(run["num_shards"])):
+        missing = sorted(set(range(run["num_shards"])) - set(found))
+        raise FileNotFoundError(f"Missing shards {missing} of {run['num_shards']} in {root}")
+
+    metas.sort(key=lambda meta: meta["start"])
+    tables = {}
+    for table in run["tables"]:
+        frames = [pd.read_parquet(os.path.join(shard_path(output_dir, meta["shard_index"], run["num_shards"]),
+                                               f"{table}.parquet")) for meta in metas]
+        tables[table] = pd.concat(frames, ignore_index=True)
+    return run, tables
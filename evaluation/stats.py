@@ -0,0 +1,228 @@
+import contextlib
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from evaluation.label_changes import encode_labels, flip_indicators
+
+# Confidence intervals and paired significance tests for the result tables, for every condition at once.
+#
+# Scores are stacked into a (conditions, rows) matrix and labels are integer-coded (see label_changes), so each
+# statistic is a few array operations however many conditions there are. Every statistic here is a ratio of
+# sums over rows (a mean drop is the sum of the drops over the number of scored rows, a flip rate the flips over
+# the rows that could flip), so a bootstrap resample only needs how often each row was drawn: one (resamples,
+# rows) matrix of row indices is drawn, turned into per-row counts, and a matrix product of the counts with the
+# stacked sums gives every statistic of every condition in every resample. The index matrix is drawn in blocks of
+# at most MAX_CELLS entries to bound memory, never one resample at a time. All conditions share the resamples, so
+# intervals for the difference between two conditions are paired as well.
+
+DEFAULT_RESAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_SEED = 0
+# Small enough that the counts of a block stay in cache while they are accumulated
+MAX_CELLS = 2 ** 20
+
+
+def resample_counts(n, resamples, rng, max_cells=MAX_CELLS):
+    # Yields (block, n) matrices of how often each of n rows is drawn in each of resamples bootstrap resamples
+    block = max(1, max_cells // max(n, 1))
+    for start in range(0, resamples, block):
+        size = min(block, resamples - start)
+        indices = rng.integers(0, n, size=(size, n)) + (np.arange(size) * n)[:, None]
+        yield np.bincount(indices.ravel(), minlength=size * n).reshape(size, n).astype(np.float64)
+
+
+def bootstrap_ratios(numerators, denominators, resamples=DEFAULT_RESAMPLES, seed=DEFAULT_SEED):
+    # Point estimates (k,) and bootstrap replicates (resamples, k) of sum(numerators) / sum(denominators) for the
+    # k columns of two (rows, k) arrays. Replicates with a zero denominator are NaN
+    numerators = np.asarray(numerators, dtype=np.float64)
+    denominators = np.asarray(denominators, dtype=np.float64)
+    n, k = numerators.shape
+    stacked = np.concatenate([numerators, denominators], axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        point = numerators.sum(axis=0) / denominators.sum(axis=0)
+        replicates = np.full((resamples, k), np.nan)
+        if n:
+            row = 0
+            for counts in resample_counts(n, resamples, np.random.default_rng(seed)):
+                sums = counts @ stacked
+                replicates[row:row + len(counts)] = sums[:, :k] / sums[:, k:]
+                row += len(counts)
+    return point, replicates
+
+
+def percentile_interval(replicates, confidence=DEFAULT_CONFIDENCE):
+    # Percentile bootstrap interval of every column, ignoring NaN replicates; NaN for columns without any
+    alpha = (1 - confidence) / 2
+    valid = ~np.isnan(replicates).all(axis=0)
+    low = np.full(replicates.shape[1], np.nan)
+    high = np.full(replicates.shape[1], np.nan)
+    if valid.any():
+        low[valid], high[valid] = np.nanpercentile(replicates[:, valid], [100 * alpha, 100 * (1 - alpha)], axis=0)
+    return low, high
+
+
+def bootstrap_pvalue(point, replicates):
+    # Two-sided p-value for a statistic of zero, from how often the centred replicates are at least as far from
+    # zero as the point estimate
+    valid = ~np.isnan(replicates)
+    extreme = (np.abs(replicates - point) >= np.abs(point)) & valid
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = (extreme.sum(axis=0) + 1) / (valid.sum(axis=0) + 1)
+    return np.where(np.isnan(point) | (valid.sum(axis=0) == 0), np.nan, p)
+
+
+def holm(pvalues):
+    # Holm-Bonferroni adjustment of a family of p-values; NaN ones are left out of the family
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full_like(pvalues, np.nan)
+    valid = ~np.isnan(pvalues)
+    p = pvalues[valid]
+    order = np.argsort(p)
+    m = len(p)
+    stepped = np.empty(m)
+    stepped[order] = np.minimum(1, np.maximum.accumulate((m - np.arange(m)) * p[order]))
+    adjusted[valid] = stepped
+    return adjusted
+
+
+@contextlib.contextmanager
+def _quiet():
+    # numpy warns about all-NaN slices (conditions without any scores), which come out as NaN as intended
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        yield
+
+
+def _stack_scores(clean, perturbed):
+    clean = np.asarray(clean, dtype=np.float64)
+    names = list(perturbed)
+    matrix = np.vstack([np.asarray(perturbed[name], dtype=np.float64) for name in names]) if names \
+        else np.empty((0, len(clean)))
+    if matrix.shape[1] != len(clean):
+        raise ValueError("Every condition needs one score per clean score")
+    return names, clean - matrix
+
+
+def _differences(pairs, names, point, replicates, confidence, columns):
+    # Paired comparisons between conditions: for each (a, b) and statistic, a - b with its interval and p-value,
+    # from the shared resamples. point and replicates hold one column per statistic and condition, statistic-major
+    index = {name: i for i, name in enumerate(names)}
+    rows = []
+    for a, b in pairs:
+        row = {"comparison": f"{a} - {b}"}
+        for j, column in enumerate(columns):
+            ia, ib = j * len(names) + index[a], j * len(names) + index[b]
+            diff_point = point[ia] - point[ib]
+            diff = (replicates[:, ia] - replicates[:, ib])[:, None]
+            low, high = percentile_interval(diff, confidence)
+            row[column] = diff_point
+            row[f"{column}_ci_low"] = low[0]
+            row[f"{column}_ci_high"] = high[0]
+            row[f"{column}_p_bootstrap"] = bootstrap_pvalue(np.array([diff_point]), diff)[0]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def score_drops(clean, perturbed):
+    # compare_toxicity_scores for every condition in {condition: scores} at once, one row per condition. Rows
+    # missing either score are left out, as pandas skips the NaN differences
+    names, drops = _stack_scores(clean, perturbed)
+    if not drops.shape[1]:
+        drops = np.full((len(names), 1), np.nan)
+    with _quiet():
+        return pd.DataFrame({
+            "condition": names,
+            "mean_drop": np.nanmean(drops, axis=1),
+            "median_drop": np.nanmedian(drops, axis=1),
+            "min_drop": np.nanmin(drops, axis=1),
+            "max_drop": np.nanmax(drops, axis=1),
+            "n": (~np.isnan(drops)).sum(axis=1),
+        })
+
+
+def bootstrap_score_drops(clean, perturbed, pairs=(), resamples=DEFAULT_RESAMPLES,
+                          confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED):
+    # Mean toxicity drop (clean - perturbed) of every condition in {condition: scores}, with a bootstrap interval
+    # and paired tests against no drop: a bootstrap p-value for the mean and a Wilcoxon signed-rank test, Holm
+    # adjusted across conditions. pairs of conditions (a, b) additionally get the difference of their mean drops.
+    # Returns (per-condition frame, pairs frame)
+    from scipy.stats import wilcoxon
+
+    names, drops = _stack_scores(clean, perturbed)
+    valid = ~np.isnan(drops)
+    point, replicates = bootstrap_ratios(np.where(valid, drops, 0).T, valid.T, resamples, seed)
+    low, high = percentile_interval(replicates, confidence)
+    p_bootstrap = bootstrap_pvalue(point, replicates)
+
+    p_wilcoxon = np.full(len(names), np.nan)
+    testable = (valid & (drops != 0)).any(axis=1)
+    if testable.any():
+        with _quiet():
+            p_wilcoxon[testable] = wilcoxon(drops[testable], axis=1, nan_policy="omit").pvalue
+
+    summary = score_drops(clean, perturbed)
+    summary = summary.assign(ci_low=low, ci_high=high, p_bootstrap=p_bootstrap, p_wilcoxon=p_wilcoxon,
+                             p_wilcoxon_holm=holm(p_wilcoxon))
+    columns = ["condition", "n", "mean_drop", "ci_low", "ci_high", "median_drop", "min_drop", "max_drop",
+               "p_bootstrap", "p_wilcoxon", "p_wilcoxon_holm"]
+    return summary[columns], _differences(pairs, names, point, replicates, confidence, ["mean_drop"])
+
+
+def flip_counts(clean_labels, perturbed):
+    # evaluate_label_changes for every condition in {condition: labels} at once, one row per condition
+    names = list(perturbed)
+    codes = np.vstack([encode_labels(perturbed[name]) for name in names]) if names \
+        else np.empty((0, len(clean_labels)), dtype=np.int8)
+    normal, toxic, normal_to_toxic, toxic_to_normal = (
+        flags.sum(axis=1) for flags in flip_indicators(encode_labels(clean_labels), codes))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return pd.DataFrame({
+            "condition": names,
+            "normal_to_toxic_rate": np.where(normal > 0, normal_to_toxic / normal, 0),
+            "toxic_to_normal_rate": np.where(toxic > 0, toxic_to_normal / toxic, 0),
+            "normal_to_toxic_count": normal_to_toxic,
+            "toxic_to_normal_count": toxic_to_normal,
+            "total_normal": normal,
+            "total_toxic": toxic,
+        })
+
+
+def bootstrap_flip_rates(clean_labels, perturbed, pairs=(), resamples=DEFAULT_RESAMPLES,
+                         confidence=DEFAULT_CONFIDENCE, seed=DEFAULT_SEED):
+    # Normal -> toxic and toxic -> normal rates of every condition in {condition: labels}, with bootstrap
+    # intervals, and an exact McNemar test of whether a condition flips verdicts one way more than the other
+    # (Holm adjusted across conditions). pairs of conditions (a, b) additionally get the difference of their rates.
+    # Returns (per-condition frame, pairs frame)
+    from scipy.stats import binom
+
+    names = list(perturbed)
+    if len(set(map(len, perturbed.values())) | {len(clean_labels)}) > 1:
+        raise ValueError("Every condition needs one label per clean label")
+    codes = np.vstack([encode_labels(perturbed[name]) for name in names]) if names \
+        else np.empty((0, len(clean_labels)), dtype=np.int8)
+    normal, toxic, normal_to_toxic, toxic_to_normal = flip_indicators(encode_labels(clean_labels), codes)
+
+    point, replicates = bootstrap_ratios(np.concatenate([normal_to_toxic, toxic_to_normal]).T,
+                                         np.concatenate([normal, toxic]).T, resamples, seed)
+    low, high = percentile_interval(replicates, confidence)
+
+    # Only discordant rows carry information; under the null each is equally likely to go either way
+    b = normal_to_toxic.sum(axis=1)
+    c = toxic_to_normal.sum(axis=1)
+    p_mcnemar = np.where(b + c > 0, np.minimum(1, 2 * binom.cdf(np.minimum(b, c), b + c, 0.5)), 1.0)
+
+    k = len(names)
+    summary = flip_counts(clean_labels, perturbed).assign(
+        normal_to_toxic_ci_low=low[:k], normal_to_toxic_ci_high=high[:k],
+        toxic_to_normal_ci_low=low[k:], toxic_to_normal_ci_high=high[k:],
+        p_mcnemar=p_mcnemar, p_mcnemar_holm=holm(p_mcnemar))
+    columns = ["condition", "total_normal", "total_toxic",
+               "normal_to_toxic_count", "normal_to_toxic_rate", "normal_to_toxic_ci_low", "normal_to_toxic_ci_high",
+               "toxic_to_normal_count", "toxic_to_normal_rate", "toxic_to_normal_ci_low", "toxic_to_normal_ci_high",
+               "p_mcnemar", "p_mcnemar_holm"]
+    differences = _differences(pairs, names, point, replicates, confidence,
+                               ["normal_to_toxic_rate", "toxic_to_normal_rate"])
+    return summary[columns], differences
@@ -1,6 +1,124 @@
-import matplotlib.pyplot as plt
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import pandas as pd
-import seaborn as sns
+
+# Headless figure rendering. Every figure is drawn on its own matplotlib Figure with an Agg canvas instead of
+# through pyplot, so figures share no global state, no GUI backend is involved, and several figures can be
+# rendered at once in worker processes with render_figures. matplotlib is imported inside the functions so that
+# importing this module stays cheap.
+#
+# Distributions are summarised before anything is drawn. Box plots get their quartiles and whiskers from one
+# groupby over a long frame of all groups and are drawn with Axes.bxp, keeping at most MAX_FLIERS outliers per
+# box, and scatter plots of more than HEXBIN_MIN_POINTS points become hexbin density plots, so the cost of
+# drawing stays flat however many rows there are.
+
+MAX_FLIERS = 200
+HEXBIN_MIN_POINTS = 5000
+HEXBIN_GRID_SIZE = 60
+
+
+def _figure(figsize):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _save(fig, save_path):
+    fig.tight_layout()
+    fig.savefig(save_path)
+    return save_path
+
+
+def _rotate_labels(ax, rotation, ha="center"):
+    for label in ax.get_xticklabels():
+        label.set(rotation=rotation, ha=ha)
+
+
+def _colours(n):
+    from matplotlib import rcParams
+
+    cycle = rcParams["axes.prop_cycle"].by_key()["color"]
+    return [cycle[i % len(cycle)] for i in range(n)]
+
+
+def long_frame(frames, column, key="condition"):
+    # Stacks column of every frame in {name: frame} that has it into one two-column frame, with key a categorical
+    # in dict order, in a single concat
+    present = {name: df[column] for name, df in frames.items() if column in df.columns}
+    if not present:
+        return pd.DataFrame({key: pd.Categorical([]), column: []})
+    values = pd.concat(present.values(), ignore_index=True)
+    keys = pd.Categorical(np.repeat(list(present), [len(s) for s in present.values()]), categories=list(present))
+    return pd.DataFrame({key: keys, column: values.to_numpy()})
+
+
+def box_stats(long, key, value, max_fliers=MAX_FLIERS):
+    # Axes.bxp statistics per group of a long frame, as matplotlib's own boxplot computes them (linear-interpolated
+    # quartiles, each whisker at the furthest point within 1.5 IQR on its side but never inside the box, points
+    # beyond the whiskers as outliers), except that groups with more than max_fliers outliers keep an evenly
+    # spaced selection of them, extremes included. Groups are in category order
+    data = long.dropna(subset=[value])
+    if data.empty:
+        return []
+    groups = data.groupby(key, observed=True, sort=False)[value]
+    quartiles = groups.quantile([0.25, 0.5, 0.75]).unstack()
+    iqr = quartiles[0.75] - quartiles[0.25]
+    values = data[value].to_numpy()
+
+    def per_row(series):
+        return series.reindex(data[key]).to_numpy()
+
+    # With no point between a bound and the box, the whisker collapses onto the box, as in matplotlib
+    lowest = data[values >= per_row(quartiles[0.25] - 1.5 * iqr)].groupby(key, observed=True, sort=False)[value].min()
+    highest = data[values <= per_row(quartiles[0.75] + 1.5 * iqr)].groupby(key, observed=True, sort=False)[value].max()
+    whislo = np.fmin(lowest.reindex(quartiles.index), quartiles[0.25])
+    whishi = np.fmax(highest.reindex(quartiles.index), quartiles[0.75])
+
+    outside = (values < per_row(whislo)) | (values > per_row(whishi))
+    outliers = dict(tuple(data.loc[outside, [key, value]].groupby(key, observed=True, sort=False)[value]))
+
+    stats = []
+    for name in data[key].cat.categories:
+        if name not in quartiles.index:
+            continue
+        fliers = np.sort(outliers[name].to_numpy()) if name in outliers else np.array([])
+        if len(fliers) > max_fliers:
+            fliers = fliers[np.linspace(0, len(fliers) - 1, max_fliers).round().astype(int)]
+        q1, med, q3 = quartiles.loc[name, [0.25, 0.5, 0.75]]
+        stats.append({
+            "label": name,
+            "q1": q1,
+            "med": med,
+            "q3": q3,
+            "whislo": whislo[name],
+            "whishi": whishi[name],
+            "fliers": fliers,
+        })
+    return stats
+
+
+def _box_figure(long, key, value, save_path, figsize, title, xlabel, ylabel, rotation=0, ha="center",
+                zero_line=False):
+    stats = box_stats(long, key, value)
+    fig = _figure(figsize)
+    ax = fig.add_subplot()
+    boxes = ax.bxp(stats, patch_artist=True, medianprops={"color": "black"})
+    for patch, colour in zip(boxes["boxes"], _colours(len(stats))):
+        patch.set_facecolor(colour)
+    if zero_line:
+        ax.axhline(0, linestyle="--")
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    _rotate_labels(ax, rotation, ha)
+    return _save(fig, save_path)
+
 
 def plot_bar(results_dict, metric="mean_drop", save_path="results_bar.png"):
     labels, means = [], []
@@ -9,162 +127,116 @@ def plot_bar(results_dict, metric="mean_drop", save_path="results_bar.png"):
             labels.append(name)
             means.append(float(df[metric].iloc[0]))
 
-    plt.figure(figsize=(12, 6))
-    bars = plt.bar(labels, means, color='skyblue')
-    plt.ylabel(f'{metric} (unperturbed - perturbed)')
-    plt.title('Mean drop in toxicity score by condition')
-    plt.xticks(rotation=30, ha='right')
+    fig = _figure((12, 6))
+    ax = fig.add_subplot()
+    bars = ax.bar(labels, means, color='skyblue')
+    ax.set_ylabel(f'{metric} (unperturbed - perturbed)')
+    ax.set_title('Mean drop in toxicity score by condition')
+    _rotate_labels(ax, 30, 'right')
 
     for b in bars:
         h = b.get_height()
-        plt.annotate(f'{h:.3f}', xy=(b.get_x() + b.get_width()/2, h),
-                     xytext=(0, 5), textcoords="offset points",
-                     ha='center', va='bottom')
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.show()
+        ax.annotate(f'{h:.3f}', xy=(b.get_x() + b.get_width()/2, h),
+                    xytext=(0, 5), textcoords="offset points",
+                    ha='center', va='bottom')
+    return _save(fig, save_path)
 
 
 def plot_box(results_dict, metric="toxicity", save_path="results_box.png"):
-    all_data = []
-    for name, df in results_dict.items():
-        if metric in df.columns:
-            for val in df[metric].dropna():
-                all_data.append({"condition": name, metric: val})
-
-    if not all_data:
+    long = long_frame(results_dict, metric)
+    if long[metric].isna().all():
         print("No data for boxplot.")
-        return
+        return None
 
-    plot_df = pd.DataFrame(all_data)
-    plt.figure(figsize=(12, 6))
-    sns.boxplot(x="condition", y=metric, data=plot_df)
-    plt.xticks(rotation=30, ha='right')
-    plt.title(f'Distribution of {metric} by condition')
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.show()
+    return _box_figure(long, "condition", metric, save_path, (12, 6), f'Distribution of {metric} by condition',
+                       "condition", metric, rotation=30, ha='right')
 
 
 def plot_scatter(scores_x, scores_y, label_x="Model X", label_y="Model Y", save_path="results_scatter.png"):
-    plt.figure(figsize=(8, 8))
-    
-    all_x, all_y, labels = [], [], []
-
+    # Conditions are paired row by row up to the shorter of the two score columns. Up to HEXBIN_MIN_POINTS
+    # points are drawn individually and coloured by condition; beyond that the point density is drawn instead
+    frames = {}
     for name in scores_x:
         if name in scores_y:
-
-            x_vals = scores_x[name]["toxicity"].tolist()
-            y_vals = scores_y[name]["toxicity"].tolist()
-
-            
-            n = min(len(x_vals), len(y_vals))
-
-            all_x.extend(x_vals[:n])
-            all_y.extend(y_vals[:n])
-            labels.extend([name] * n)
-
-
-    df = pd.DataFrame({
-        "x": all_x,
-        "y": all_y,
-        "condition": labels
-    })
-
-    sns.scatterplot(data=df, x="x", y="y", hue="condition", alpha=0.6)
-
-    plt.xlabel(label_x)
-    plt.ylabel(label_y)
-    plt.title("Raw Toxicity Score Comparison")
-    plt.grid(True)
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.show()
-
+            n = min(len(scores_x[name]), len(scores_y[name]))
+            frames[name] = pd.DataFrame({"x": scores_x[name]["toxicity"].to_numpy()[:n],
+                                         "y": scores_y[name]["toxicity"].to_numpy()[:n]})
+    df = pd.concat(frames, names=["condition", None]).reset_index(level=0) if frames else \
+        pd.DataFrame({"condition": [], "x": [], "y": []})
+
+    fig = _figure((8, 8))
+    ax = fig.add_subplot()
+    if len(df) > HEXBIN_MIN_POINTS:
+        points = df.dropna(subset=["x", "y"])
+        density = ax.hexbin(points["x"], points["y"], gridsize=HEXBIN_GRID_SIZE, bins="log", mincnt=1,
+                            cmap="viridis")
+        fig.colorbar(density, ax=ax, label="texts (all conditions)")
+    else:
+        for (name, group), colour in zip(df.groupby("condition", sort=False), _colours(len(frames))):
+            ax.scatter(group["x"], group["y"], alpha=0.6, color=colour, label=name, edgecolors="white",
+                       linewidths=0.5)
+        if frames:
+            ax.legend(title="condition")
+
+    ax.set_xlabel(label_x)
+    ax.set_ylabel(label_y)
+    ax.set_title("Raw Toxicity Score Comparison")
+    ax.grid(True)
+    return _save(fig, save_path)
 
 
 def plot_label_changes(results_dict, save_path="HX_label_changes.png"):
+    plot_df = pd.concat({name: df[["normal_to_toxic_rate", "toxic_to_normal_rate"]].iloc[:1]
+                         for name, df in results_dict.items()}).droplevel(1)
 
-    rows = []
-    for name, df in results_dict.items():
-        rows.append({
-            "scenario": name,
-            "normal_to_toxic_rate": df["normal_to_toxic_rate"].iloc[0],
-            "toxic_to_normal_rate": df["toxic_to_normal_rate"].iloc[0],
-        })
-
-    plot_df = pd.DataFrame(rows)
+    fig = _figure((12, 6))
+    ax = fig.add_subplot()
+    x = np.arange(len(plot_df))
 
-    plt.figure(figsize=(12, 6))
-    x = range(len(plot_df))
+    ax.bar(x - 0.2, plot_df["normal_to_toxic_rate"], width=0.4, label="Normal → Toxic")
+    ax.bar(x + 0.2, plot_df["toxic_to_normal_rate"], width=0.4, label="Toxic → Normal")
 
-    plt.bar([i - 0.2 for i in x], plot_df["normal_to_toxic_rate"], width=0.4, label="Normal → Toxic")
-    plt.bar([i + 0.2 for i in x], plot_df["toxic_to_normal_rate"], width=0.4, label="Toxic → Normal")
+    ax.set_xticks(x, plot_df.index, rotation=45, ha="right")
+    ax.set_ylabel("Rate")
+    ax.set_title("HateXplain Label Change rates")
+    ax.legend()
+    return _save(fig, save_path)
 
-    plt.xticks(x, plot_df["scenario"], rotation=45, ha="right")
-    plt.ylabel("Rate")
-    plt.title("HateXplain Label Change rates")
-    plt.legend()
-    plt.tight_layout()
 
-    plt.savefig(save_path)
-    plt.show()
-    
 def plot_similarity_distributions(human_df, auto_df, save_path="semantic_similarity_boxplot.png"):
-    human_df["type"] = "human"
-    auto_df["type"] = "automated"
-
-    df = pd.concat([human_df, auto_df])
-
-    plt.figure(figsize=(10, 6))
-    sns.boxplot(data=df, x="type", y="similarity")
-    plt.title("Semantic Similarity: Human vs Automated Perturbations")
-    plt.ylabel("Cosine Similarity")
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.show()
+    long = long_frame({"human": human_df, "automated": auto_df}, "similarity", key="type")
+    return _box_figure(long, "type", "similarity", save_path, (10, 6),
+                       "Semantic Similarity: Human vs Automated Perturbations", "type", "Cosine Similarity")
 
 
 def plot_levenshtein_box(results, save_path="levenshtein_boxplot.png"):
-    plt.figure(figsize=(10, 6))
+    long = long_frame(results, "lev_distance", key="type")
+    return _box_figure(long, "type", "lev_distance", save_path, (10, 6),
+                       "Levenshtein Distance Across Perturbation Types", "Perturbation Type",
+                       "Character-level Levenshtein Distance", rotation=45)
 
-    all_df = []
-    for label, df in results.items():
-        temp = df.copy()
-        temp["type"] = label
-        all_df.append(temp)
-
-    full = pd.concat(all_df)
-
-    sns.boxplot(data=full, x="type", y="lev_distance")
-    plt.title("Levenshtein Distance Across Perturbation Types")
-    plt.xlabel("Perturbation Type")
-    plt.ylabel("Character-level Levenshtein Distance")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.show()
 
 def plot_readability_box(results, save_path="flesch_change_boxplot.png"):
-    plt.figure(figsize=(10, 6))
-
-    all_df = []
-    for label, df in results.items():
-        temp = df.copy()
-        temp["type"] = label
-        all_df.append(temp)
+    long = long_frame(results, "flesch_change", key="type")
+    return _box_figure(long, "type", "flesch_change", save_path, (10, 6),
+                       "Flesch Reading Ease Change Across Conditions", "Perturbation Type",
+                       "Change in Flesch Score (perturbed - unperturbed)", rotation=45, zero_line=True)
 
-    full = pd.concat(all_df)
 
-    sns.boxplot(data=full, x="type", y="flesch_change")
-    plt.title("Flesch Reading Ease Change Across Conditions")
-    plt.xlabel("Perturbation Type")
-    plt.ylabel("Change in Flesch Score (perturbed - unperturbed)")
-    plt.axhline(0, linestyle="--")
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-    plt.savefig(save_path)
-    plt.show()
+def _render(job):
+    func, kwargs = job
+    return func(**kwargs)
 
 
+def render_figures(jobs, workers=None):
+    # Renders [(plot function, keyword arguments), ...] in a pool of worker processes, one figure per task, and
+    # returns what each call returned (the saved paths) in job order. The functions have to be module-level so
+    # they can be sent to the workers, and their arguments are pickled over, so summarising tables first is
+    # cheaper than sending raw ones. Workers are spawned, not forked, as report() runs after the experiment's lane
+    # threads and torch's thread pools have started, and a fork taken then can deadlock on a lock one of them held
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        return [_render(job) for job in jobs]
 
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return list(executor.map(_render, jobs))
@@ -1,5 +1,10 @@
 import re
-from textblob import TextBlob
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+from models import registry
 
 LEETSPEAK_MAP = {
     "0": "o", "1": "i", "3": "e", "4": "a",
@@ -36,6 +41,94 @@ def obfuscation_score(text):
     return min(score, 1.8)
 
 
+FEATURE_NAMES = ["non_alpha_ratio", "leet_ratio", "consonant_ratio", "whitespace_frag", "repetition"]
+
+_ALPHA, _SPACE, _LEET, _VOWEL = 1, 2, 4, 8
+_NEWLINE = ord("\n")
+
+
+@lru_cache(maxsize=None)
+def _char_flags():
+    # One byte of character-class flags per Unicode code point, built once per process
+    flags = np.zeros(sys.maxunicode + 1, dtype=np.uint8)
+    for codepoint in range(sys.maxunicode + 1):
+        char = chr(codepoint)
+        flags[codepoint] = (_ALPHA if char.isalpha() else 0) | (_SPACE if char.isspace() else 0)
+    for char in LEETSPEAK_MAP:
+        flags[ord(char)] |= _LEET
+    for char in "aeiou":
+        flags[ord(char)] |= _VOWEL
+    return flags
+
+
+def _segment_counts(mask, starts, ends):
+    # Number of True values of mask inside each [start, end) segment
+    csum = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+    return csum[ends] - csum[starts]
+
+
+def obfuscation_scores(texts):
+    # Column version of obfuscation_score: every text is lowercased and packed into one array of code points,
+    # each feature is computed with NumPy over that array and summed per text. Returns the feature matrix
+    # (columns in FEATURE_NAMES order) and the scores, which match obfuscation_score exactly
+    texts = [t if isinstance(t, str) else (str(t) if t is not None else "") for t in texts]
+    lowered = [t.lower() for t in texts]
+    n = len(texts)
+
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    low_lengths = np.fromiter(map(len, lowered), dtype=np.int64, count=n)
+    ends = np.cumsum(low_lengths)
+    starts = ends - low_lengths
+
+    codepoints = np.frombuffer("".join(lowered).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+
+    flags = _char_flags()[codepoints]
+    space = (flags & _SPACE) > 0
+
+    alpha_count = _segment_counts((flags & _ALPHA) > 0, starts, ends)
+    leet_count = _segment_counts((flags & _LEET) > 0, starts, ends)
+    vowels = _segment_counts((flags & _VOWEL) > 0, starts, ends)
+
+    # A word starts wherever a non-space follows a space or the start of its text, which is what split() counts
+    previous_space = np.ones(len(codepoints), dtype=bool)
+    previous_space[1:] = space[:-1]
+    previous_space[starts[low_lengths > 0]] = True
+    words = _segment_counts(~space & previous_space, starts, ends)
+
+    # Four identical characters in a row, other than newlines which "." does not match, and never across two texts
+    same_as_next = np.zeros(len(codepoints), dtype=bool)
+    same_as_next[:-1] = (codepoints[:-1] == codepoints[1:]) & (codepoints[:-1] != _NEWLINE)
+    same_as_next[ends[low_lengths > 0] - 1] = False
+    run_start = np.zeros(len(codepoints), dtype=bool)
+    run_start[:-3] = same_as_next[:-3] & same_as_next[1:-2] & same_as_next[2:-1]
+
+    length = np.maximum(lengths, 1)
+    consonants = alpha_count - vowels
+
+    features = np.zeros((n, len(FEATURE_NAMES)))
+    features[:, 0] = (low_lengths - alpha_count) / length
+    features[:, 1] = leet_count / length
+    features[:, 2] = consonants / np.maximum(consonants + vowels, 1)
+    features[:, 3] = words * 2 >= low_lengths
+    features[:, 4] = _segment_counts(run_start, starts, ends) > 0
+
+    # Same weights and summation order as obfuscation_score, so the scores are bit-for-bit identical
+    scores = np.minimum(
+        0.35 * features[:, 0] +
+        0.25 * features[:, 1] +
+        0.15 * features[:, 2] +
+        0.15 * features[:, 3] +
+        0.10 * features[:, 4],
+        1.8
+    )
+
+    empty = lengths == 0
+    features[empty] = 0
+    scores[empty] = 0
+
+    return features, scores
+
+
 def soft_normalise(text):
     t = text.lower()
     for k, v in LEETSPEAK_MAP.items():
@@ -44,20 +137,45 @@ def soft_normalise(text):
     return t
 
 
-def detect_and_spellcheck(texts, threshold=0.35):
+def _load_symspell():
+    from mitigations.spelling import load_symspell
+    return load_symspell()
 
-    processed_texts = []
 
-    for text in texts:
-        if not isinstance(text, str):
-            text = str(text) if text is not None else ""
+registry.register("symspell", _load_symspell)
+
+
+def textblob_correct(text):
+    from textblob import TextBlob
+    return str(TextBlob(text).correct())
+
+
+def symspell_correct(text):
+    return registry.get("symspell").correct(text)
+
+
+# Spelling correction engines selectable by name; any callable taking and returning a string also works
+CORRECTORS = {
+    "textblob": textblob_correct,
+    "symspell": symspell_correct,
+}
+
+
+def detect_and_spellcheck(texts, threshold=0.35, corrector="symspell"):
+
+    correct = CORRECTORS[corrector] if isinstance(corrector, str) else corrector
+
+    texts = [t if isinstance(t, str) else (str(t) if t is not None else "") for t in texts]
+    _, scores = obfuscation_scores(texts)
+
+    processed_texts = []
 
-        score = obfuscation_score(text)
+    for text, score in zip(texts, scores):
         cleaned = soft_normalise(text)
 
         if score > threshold:
             try:
-                cleaned = str(TextBlob(cleaned).correct())
+                cleaned = correct(cleaned)
             except:
                 pass
 
@@ -1,9 +1,25 @@
 import re
 import unicodedata
 
+import numpy as np
+import pandas as pd
+
 leet_dict = {'0':'o','1':'i','3':'e','4':'a','5':'s','7':'t','@':'a','!':'i','+':'t','$':'s','|':'i'}
 translation = str.maketrans(leet_dict)
 
+# Common Cyrillic and Greek homoglyphs of Latin letters. NFKD leaves these alone, so without this map they are
+# dropped by the ASCII fold instead of being read as the letter they imitate. Only used when confusables=True
+confusables_dict = {
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p', 'с': 'c',
+    'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's', 'і': 'i', 'ї': 'i', 'ј': 'j', 'һ': 'h', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w',
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't',
+    'υ': 'u', 'χ': 'x', 'ω': 'w',
+}
+
+# Collapses runs of three or more of the same letter to two and drops every character that is neither a letter
+# nor whitespace, in one pass. Runs of other characters need no collapsing because they are dropped anyway
+_FUSED = re.compile(r'([a-z])\1{2,}|[^a-z\s]+')
+
 def normalise_text(text):
     text = text.lower()
     text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('utf-8')
@@ -12,3 +28,46 @@ def normalise_text(text):
     text = re.sub(r'[^a-z\s]', '', text)
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
+
+
+class _FoldTable(dict):
+    # Translation table that maps a lowercased character straight to what NFKD, the ASCII fold and the leet
+    # translation would turn it into. NFKD works character by character once combining marks (which are never
+    # ASCII) are dropped, so a per-character table gives the same result as normalising the whole string.
+    # ASCII entries are built up front; other characters are filled in the first time they are seen
+
+    def __init__(self, extra=None):
+        super().__init__()
+        self.extra = extra or {}
+        for codepoint in range(128):
+            self[codepoint] = chr(codepoint).translate(translation)
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        char = self.extra.get(char, char)
+        folded = unicodedata.normalize('NFKD', char).encode('ascii', 'ignore').decode('utf-8').translate(translation)
+        self[codepoint] = folded
+        return folded
+
+
+_fold_table = _FoldTable()
+_confusables_fold_table = _FoldTable(confusables_dict)
+
+
+def _normalise_folded(text, table):
+    text = _FUSED.sub(r'\1\1', text.lower().translate(table))
+    return ' '.join(text.split())
+
+
+def normalise_texts(texts, confusables=False):
+    # Batch version of normalise_text with identical output when confusables is False
+    table = _confusables_fold_table if confusables else _fold_table
+    return [_normalise_folded(t, table) for t in texts]
+
+
+def normalise_series(series, confusables=False):
+    # Column version for large frames. Message columns repeat heavily, so each distinct value is normalised
+    # once and broadcast back through the factorized codes. Missing values stay missing
+    codes, uniques = pd.factorize(series)
+    normalised = np.array(normalise_texts(uniques, confusables) + [None], dtype=object)
+    return pd.Series(normalised[codes], index=series.index, name=series.name)
@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from models import registry
+from mitigations.detection_spellcheck import _char_flags, detect_and_spellcheck
+from mitigations.normalisation import normalise_texts
+
+# Process-pool execution for the CPU-bound mitigations. Texts are split into fixed-size chunks, each worker
+# processes whole chunks, and the chunks are put back together in input order, so the output is exactly what
+# the serial functions return.
+#
+# Workers are spawned rather than forked. Callers such as the readability nodes of run.py's experiment run on a
+# lane thread while other lanes, the Perspective request threads and torch's thread pools are alive, and a fork
+# taken then can copy a lock some other thread holds and deadlock the child. Spawned workers start from a fresh
+# interpreter, so registry.override() calls made in the parent do not reach them.
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _init_worker(preload):
+    # Runs once in every worker process, so the spelling index and lookup tables are built once per process
+    # rather than once per chunk
+    _char_flags()
+    registry.preload(*preload)
+
+
+def _normalise_chunk(args):
+    chunk, confusables = args
+    return normalise_texts(chunk, confusables)
+
+
+def _spellcheck_chunk(args):
+    chunk, threshold, corrector = args
+    return detect_and_spellcheck(chunk, threshold, corrector)
+
+
+def _chunks(texts, chunk_size):
+    return [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+
+
+def parallel_map(func, jobs, workers=None, preload=()):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(jobs) <= 1:
+        return [item for result in map(func, jobs) for item in result]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_init_worker, initargs=(tuple(preload),)) as executor:
+        return [item for result in executor.map(func, jobs) for item in result]
+
+
+def parallel_normalise(texts, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, confusables=False):
+    jobs = [(chunk, confusables) for chunk in _chunks(list(texts), chunk_size)]
+    return parallel_map(_normalise_chunk, jobs, workers)
+
+
+def parallel_detect_and_spellcheck(texts, threshold=0.35, corrector="symspell", workers=None,
+                                   chunk_size=DEFAULT_CHUNK_SIZE):
+    # A custom corrector has to be picklable (e.g. a module-level function) to reach the workers
+    preload = ("symspell",) if corrector == "symspell" else ()
+    if preload:
+        # Builds and saves the index in this process first, so the workers load it instead of all building it
+        registry.get("symspell")
+
+    jobs = [(chunk, threshold, corrector) for chunk in _chunks(list(texts), chunk_size)]
+    return parallel_map(_spellcheck_chunk, jobs, workers, preload)
@@ -0,0 +1,172 @@
+import itertools
+import os
+import pickle
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+# Symmetric-delete spelling correction (the SymSpell approach). Every dictionary word is indexed under all the
+# strings reachable from it by deleting up to max_distance characters, so at lookup time only the deletes of the
+# input have to be generated, rather than every insert, replace and transpose as TextBlob's corrector does.
+# Candidates are then verified with a real edit distance. Ranking follows TextBlob: known words are kept as they
+# are, otherwise the closest candidates win and ties go to the most frequent word.
+
+INDEX_PATH = os.getenv("SYMSPELL_INDEX_PATH", ".symspell_index.pkl")
+DEFAULT_MAX_DISTANCE = 2
+DEFAULT_PREFIX_LENGTH = 7
+DEFAULT_MEMO_SIZE = 100_000
+
+# Characters that soft_normalise leaves behind or maps ambiguously: digits it does not translate, and "i",
+# which it produces for "1" even when the writer meant "l"
+LEET_ALTERNATIVES = {"2": "z", "6": "g", "8": "b", "9": "g", "i": "l"}
+MAX_LEET_POSITIONS = 4
+
+_WORD = re.compile(r"\w+")
+
+
+def _deletes(word, max_distance):
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - found
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b, max_distance):
+    # Optimal string alignment distance (Levenshtein plus adjacent transpositions), giving up past max_distance
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def leet_variants(token):
+    # The token itself first, then every combination of the ambiguous characters swapped for their alternatives
+    positions = [i for i, c in enumerate(token) if c in LEET_ALTERNATIVES][:MAX_LEET_POSITIONS]
+    yield token
+    for count in range(1, len(positions) + 1):
+        for chosen in itertools.combinations(positions, count):
+            chars = list(token)
+            for i in chosen:
+                chars[i] = LEET_ALTERNATIVES[chars[i]]
+            yield "".join(chars)
+
+
+class SymSpellCorrector:
+
+    def __init__(self, frequencies, max_distance=DEFAULT_MAX_DISTANCE, prefix_length=DEFAULT_PREFIX_LENGTH,
+                 memo_size=DEFAULT_MEMO_SIZE, index=None):
+        self.frequencies = dict(frequencies)
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.memo_size = memo_size
+        self.index = index if index is not None else self._build_index()
+        self.correct_token = lru_cache(maxsize=memo_size)(self._correct_token)
+
+    def _build_index(self):
+        # Deletes are only generated from the first prefix_length characters, which keeps the index small;
+        # candidates found through a shared prefix are checked against the whole word at lookup time
+        index = defaultdict(list)
+        for word in self.frequencies:
+            for deleted in _deletes(word[:self.prefix_length], self.max_distance):
+                index[deleted].append(word)
+        return dict(index)
+
+    def lookup(self, token):
+        # Returns (best word, distance), or (token, None) when nothing in the dictionary is close enough
+        if token in self.frequencies:
+            return token, 0
+
+        prefix = token[:self.prefix_length]
+        seen = set()
+        best = None
+
+        for deleted in _deletes(prefix, self.max_distance):
+            for word in self.index.get(deleted, ()):
+                if word in seen:
+                    continue
+                seen.add(word)
+
+                distance = edit_distance(token, word, self.max_distance)
+                if distance > self.max_distance:
+                    continue
+
+                # Closest first, then most frequent, then the alphabetically later word, matching TextBlob's ranking
+                rank = (-distance, self.frequencies[word], word)
+                if best is None or rank > best:
+                    best = rank
+
+        if best is None:
+            return token, None
+        return best[2], -best[0]
+
+    def _correct_token(self, token):
+        # Same pass-through rules as TextBlob: single characters and numbers are never corrected
+        if len(token) == 1 or token.replace(".", "").isdigit():
+            return token
+
+        lowered = token.lower()
+        best, best_distance = lowered, None
+        # A leet variant only wins when it is strictly closer to a dictionary word than the token as written
+        for variant in leet_variants(lowered):
+            word, distance = self.lookup(variant)
+            if distance is not None and (best_distance is None or distance < best_distance):
+                best, best_distance = word, distance
+            if best_distance == 0:
+                break
+
+        return best.title() if token.istitle() else best
+
+    def correct(self, text):
+        return _WORD.sub(lambda m: self.correct_token(m.group(0)), text)
+
+    def save(self, path=INDEX_PATH):
+        state = {
+            "frequencies": self.frequencies,
+            "max_distance": self.max_distance,
+            "prefix_length": self.prefix_length,
+            "index": self.index,
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH, memo_size=DEFAULT_MEMO_SIZE):
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        return cls(memo_size=memo_size, **state)
+
+    @classmethod
+    def from_textblob(cls, **kwargs):
+        # Same word list and counts that TextBlob.correct() uses
+        from textblob.en import spelling
+
+        if len(spelling) == 0:
+            spelling.load()
+        return cls(dict(spelling), **kwargs)
+
+
+def load_symspell(path=INDEX_PATH):
+    # Loads the serialised index if there is one, otherwise builds it from TextBlob's word list and saves it
+    if path and os.path.exists(path):
+        return SymSpellCorrector.load(path)
+
+    corrector = SymSpellCorrector.from_textblob()
+    if path:
+        corrector.save(path)
+    return corrector
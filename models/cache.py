@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from evaluation import instrumentation
+from models import registry
+
+# On-disk score cache shared by all scorers. Entries are keyed by a model id and the SHA-256 of the text,
+# so re-runs and overlapping conditions only pay for texts that have never been scored by that model.
+# Set SCORE_CACHE_PATH to an empty string to disable caching.
+
+CACHE_PATH = os.getenv("SCORE_CACHE_PATH", ".score_cache.sqlite")
+DEFAULT_MAX_ENTRIES = 1_000_000
+EVICT_EVERY = 10_000
+_SQL_BATCH = 500
+
+
+def text_key(text):
+    return hashlib.sha256(str(text).encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class ScoreCache:
+
+    def __init__(self, path=CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_age=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = Counter()
+        self.misses = Counter()
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (model, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scores_accessed ON scores (accessed)")
+        self._conn.commit()
+
+    def get_many(self, model_id, keys):
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        oldest = now - self.max_age if self.max_age else None
+
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = keys[start:start + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value, created FROM scores WHERE model = ? AND key IN ({placeholders})",
+                    [model_id, *batch],
+                ).fetchall()
+                for key, value, created in rows:
+                    if oldest is None or created >= oldest:
+                        found[key] = json.loads(value)
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE scores SET accessed = ? WHERE model = ? AND key = ?",
+                    [(now, model_id, key) for key in found],
+                )
+                self._conn.commit()
+
+        self.hits[model_id] += len(found)
+        self.misses[model_id] += len(keys) - len(found)
+        return found
+
+    def put_many(self, model_id, items):
+        now = time.time()
+        rows = [(model_id, key, json.dumps(value), now, now) for key, value in items]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            self._writes_since_evict += len(rows)
+            due = self._writes_since_evict >= EVICT_EVERY
+
+        if due:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            if self.max_age:
+                self._conn.execute("DELETE FROM scores WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                # Least recently used entries go first once the cache grows past max_entries
+                self._conn.execute(
+                    "DELETE FROM scores WHERE rowid IN ("
+                    "SELECT rowid FROM scores ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            self._conn.commit()
+            self._writes_since_evict = 0
+
+    def clear(self, model_id=None):
+        with self._lock:
+            if model_id is None:
+                self._conn.execute("DELETE FROM scores")
+            else:
+                self._conn.execute("DELETE FROM scores WHERE model = ?", (model_id,))
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def stats(self):
+        models = sorted(set(self.hits) | set(self.misses))
+        return {
+            model_id: {
+                "hits": self.hits[model_id],
+                "misses": self.misses[model_id],
+                "hit_rate": self.hits[model_id] / max(self.hits[model_id] + self.misses[model_id], 1),
+            }
+            for model_id in models
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _load_score_cache():
+    return ScoreCache(CACHE_PATH) if CACHE_PATH else None
+
+
+registry.register("score_cache", _load_score_cache)
+
+
+def cached_scores(model_id, texts, score_fn, cache=None):
+    # Returns one score per text in input order. Duplicates within the batch are scored once,
+    # cached texts are not scored at all, and score_fn only ever sees the unique misses.
+    # Scores of None are treated as failures and are not cached.
+    texts = list(texts)
+    cache = cache if cache is not None else registry.get("score_cache")
+    instrumentation.count("texts_processed", len(texts), model=model_id)
+
+    if cache is None:
+        unique = list(dict.fromkeys(texts))
+        instrumentation.count("texts_scored", len(unique), model=model_id)
+        scored = dict(zip(unique, score_fn(unique)))
+        return [scored[t] for t in texts]
+
+    keys = [text_key(t) for t in texts]
+    first_seen = {}
+    for key, text in zip(keys, texts):
+        first_seen.setdefault(key, text)
+
+    found = cache.get_many(model_id, first_seen)
+    missing = [key for key in first_seen if key not in found]
+    instrumentation.count("cache_hits", len(found), model=model_id)
+    instrumentation.count("cache_misses", len(missing), model=model_id)
+    instrumentation.count("texts_scored", len(missing), model=model_id)
+
+    if missing:
+        new_scores = score_fn([first_seen[key] for key in missing])
+        fresh = dict(zip(missing, new_scores))
+        cache.put_many(model_id, [(key, value) for key, value in fresh.items() if value is not None])
+        found.update(fresh)
+
+    return [found[key] for key in keys]
+
+
+def cache_stats():
+    if not registry.is_loaded("score_cache") or registry.get("score_cache") is None:
+        return {}
+    return registry.get("score_cache").stats()
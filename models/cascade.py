@@ -0,0 +1,152 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from evaluation.label_changes import TOXIC_LABELS
+from mitigations.detection_spellcheck import obfuscation_scores
+from mitigations.normalisation import normalise_texts
+from models.detoxify_model import evaluate_toxicity, evaluate_toxicity_small
+
+# Tiered scoring. Every text is triaged by its obfuscation score and by a small model on the normalised text, both
+# cheap next to full BERT inference or an API call. Only texts the triage is unsure about go on to the expensive
+# scorer: those whose triage toxicity falls inside the uncertain band [low, high), and those that look obfuscated,
+# which is where a small model on normalised text is least trustworthy. Everything else keeps the triage verdict.
+
+# Triage toxicity below the band is taken as non-toxic and at or above it as toxic
+DEFAULT_BANDS = (0.2, 0.8)
+# Same cut-off detect_and_spellcheck uses: a text scoring above it is obfuscated
+OBFUSCATION_THRESHOLD = 0.35
+# A toxicity score at or above this is a toxic verdict
+DECISION_THRESHOLD = 0.5
+
+
+def _as_text(texts):
+    return [t if isinstance(t, str) else (str(t) if t is not None else "") for t in texts]
+
+
+def triage_scores(texts):
+    # Toxicity of the normalised texts according to the small Detoxify model
+    return evaluate_toxicity_small(normalise_texts(texts))["toxicity"].to_numpy(dtype=np.float64)
+
+
+def _detoxify(texts, threshold):
+    scores = evaluate_toxicity(texts)["toxicity"].to_numpy(dtype=np.float64)
+    return scores, scores >= threshold
+
+
+def _perspective(texts, threshold):
+    from models.perspective import evaluate_perspective
+
+    # Failed requests come back as NaN and count as non-toxic
+    scores = pd.to_numeric(evaluate_perspective(texts)["toxicity"], errors="coerce").to_numpy(dtype=np.float64)
+    return scores, np.nan_to_num(scores, nan=-np.inf) >= threshold
+
+
+def _hatexplain(texts, threshold):
+    from models.hatexplain import hatexplain
+
+    # HateXplain gives a label rather than a score
+    labels = hatexplain(texts)
+    return np.full(len(texts), np.nan), np.array([label in TOXIC_LABELS for label in labels], dtype=bool)
+
+
+# Expensive scorers a cascade can escalate to. Each maps (texts, decision threshold) to (scores, toxic verdicts)
+ESCALATION_SCORERS = {
+    "detoxify": _detoxify,
+    "perspective": _perspective,
+    "hatexplain": _hatexplain,
+}
+
+
+def escalation_mask(triage, obfuscation, bands=DEFAULT_BANDS, obfuscation_threshold=OBFUSCATION_THRESHOLD):
+    low, high = bands
+    if not 0 <= low <= high <= 1:
+        raise ValueError(f"Confidence band {bands} must satisfy 0 <= low <= high <= 1")
+    return ((triage >= low) & (triage < high)) | (obfuscation > obfuscation_threshold)
+
+
+def cascade_scores(texts, escalate_to="detoxify", bands=DEFAULT_BANDS, obfuscation_threshold=OBFUSCATION_THRESHOLD,
+                   decision_threshold=DECISION_THRESHOLD):
+    # One row per text: the triage toxicity and obfuscation score, whether the text was escalated, and the final
+    # score and verdict, from the escalation scorer for escalated texts and from the triage for the rest
+    scorer = ESCALATION_SCORERS[escalate_to]
+    texts = _as_text(texts)
+
+    _, obfuscation = obfuscation_scores(texts)
+    triage = triage_scores(texts)
+    escalated = escalation_mask(triage, obfuscation, bands, obfuscation_threshold)
+
+    score = triage.copy()
+    toxic = triage >= decision_threshold
+    rows = np.flatnonzero(escalated)
+    if len(rows):
+        score[rows], toxic[rows] = scorer([texts[i] for i in rows], decision_threshold)
+
+    return pd.DataFrame({
+        "triage_score": triage,
+        "obfuscation": obfuscation,
+        "escalated": escalated,
+        "tier": np.where(escalated, escalate_to, "triage"),
+        "score": score,
+        "toxic": toxic,
+    })
+
+
+def cascade_report(texts, escalate_to="detoxify", bands=DEFAULT_BANDS, obfuscation_threshold=OBFUSCATION_THRESHOLD,
+                   decision_threshold=DECISION_THRESHOLD):
+    # Runs the cascade and, for comparison, the escalation scorer on every text. Reports how many texts were
+    # escalated, how often the cascade's verdict agrees with the full pipeline's, and the time each took.
+    # Timings only mean something with the score cache disabled
+    texts = _as_text(texts)
+    scorer = ESCALATION_SCORERS[escalate_to]
+
+    start = time.perf_counter()
+    cascade = cascade_scores(texts, escalate_to, bands, obfuscation_threshold, decision_threshold)
+    cascade_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    full_scores, full_toxic = scorer(texts, decision_threshold)
+    full_seconds = time.perf_counter() - start
+
+    triaged = ~cascade["escalated"].to_numpy()
+    toxic = cascade["toxic"].to_numpy()
+    n = len(texts)
+    return {
+        "texts": n,
+        "escalation_rate": float(1 - triaged.mean()) if n else 0.0,
+        "agreement": float((toxic == full_toxic).mean()) if n else 1.0,
+        # Agreement on the texts the cascade decided without escalating; escalated ones agree by construction
+        "triage_agreement": float((toxic[triaged] == full_toxic[triaged]).mean()) if triaged.any() else 1.0,
+        "false_negatives": int((~toxic & full_toxic).sum()),
+        "false_positives": int((toxic & ~full_toxic).sum()),
+        "score_mae": float(np.nanmean(np.abs(cascade["score"].to_numpy() - full_scores)))
+        if n and not np.isnan(full_scores).all() else None,
+        "cascade_seconds": cascade_seconds,
+        "full_seconds": full_seconds,
+    }
+
+
+def cascade_tradeoff(texts, bands_list, escalate_to="detoxify", obfuscation_threshold=OBFUSCATION_THRESHOLD,
+                     decision_threshold=DECISION_THRESHOLD):
+    # Escalation rate and agreement with the full pipeline for each confidence band in bands_list. The triage
+    # and the full scorer run once on every text, and each band only changes which verdict is kept
+    texts = _as_text(texts)
+    _, obfuscation = obfuscation_scores(texts)
+    triage = triage_scores(texts)
+    _, full_toxic = ESCALATION_SCORERS[escalate_to](texts, decision_threshold)
+    triage_toxic = triage >= decision_threshold
+
+    rows = []
+    for bands in bands_list:
+        escalated = escalation_mask(triage, obfuscation, bands, obfuscation_threshold)
+        toxic = np.where(escalated, full_toxic, triage_toxic)
+        rows.append({
+            "low": bands[0],
+            "high": bands[1],
+            "escalation_rate": float(escalated.mean()) if len(texts) else 0.0,
+            "agreement": float((toxic == full_toxic).mean()) if len(texts) else 1.0,
+            "false_negatives": int((~toxic & full_toxic).sum()),
+            "false_positives": int((toxic & ~full_toxic).sum()),
+        })
+    return pd.DataFrame(rows)
@@ -1,8 +1,110 @@
-from detoxify import Detoxify
+from itertools import islice
+import os
+import numpy as np
 import pandas as pd
 
-model = Detoxify('original')
+from evaluation import instrumentation
+from models import registry
+from models.cache import cached_scores
+from models.onnx_backend import load_onnx_classifier, resolve_backend
 
-def evaluate_toxicity(texts):
-    results = model.predict(texts)
-    return pd.DataFrame(results)
+DEFAULT_CHUNK_SIZE = 256
+CACHE_ID = "detoxify:original"
+SMALL_CACHE_ID = "detoxify:original-small"
+# Quantised scores differ slightly from the PyTorch ones, so they are cached apart
+ONNX_CACHE_ID = "detoxify-onnx-int8:original"
+# What the 'original' checkpoint is built on and the class names Detoxify reports for it, so the ONNX backend can
+# tokenise and label without loading the PyTorch checkpoint
+TOKENIZER_NAME = "bert-base-uncased"
+CLASS_NAMES = ["toxicity", "severe_toxicity", "obscene", "threat", "insult", "identity_attack"]
+
+
+def _load_detoxify():
+    from detoxify import Detoxify
+    return Detoxify('original')
+
+
+def _load_detoxify_small():
+    # Distilled variant of the same model, used where a cheaper first opinion is enough
+    from detoxify import Detoxify
+    return Detoxify('original-small')
+
+
+def _load_detoxify_onnx():
+    # The PyTorch checkpoint is only loaded to export the model on first use
+    from transformers import BertTokenizer
+
+    return load_onnx_classifier("detoxify-original", BertTokenizer.from_pretrained(TOKENIZER_NAME),
+                                lambda: _load_detoxify().model, labels=CLASS_NAMES)
+
+
+registry.register("detoxify", _load_detoxify)
+registry.register("detoxify_small", _load_detoxify_small)
+registry.register("detoxify_onnx", _load_detoxify_onnx)
+
+
+def _predict_rows(texts, model="detoxify"):
+    detoxify = registry.get(model)
+    with instrumentation.timer(f"model/{model}"):
+        results = detoxify.predict(texts)
+    return [dict(zip(results, values)) for values in zip(*results.values())]
+
+
+def _predict_rows_onnx(texts):
+    texts = list(texts)
+    if not texts:
+        return []
+    classifier = registry.get("detoxify_onnx")
+    with instrumentation.timer("model/detoxify_onnx"):
+        logits = classifier.logits(texts)
+    # Detoxify's 'original' model is multi-label, so every class gets its own sigmoid
+    scores = 1 / (1 + np.exp(-logits.astype(np.float64)))
+    return [dict(zip(classifier.labels, row)) for row in scores.tolist()]
+
+
+def _scorer(backend):
+    # (cache id, scoring function) for the chosen backend; by default the INFERENCE_BACKEND setting decides
+    if resolve_backend(backend) == "onnx":
+        return ONNX_CACHE_ID, _predict_rows_onnx
+    return CACHE_ID, _predict_rows
+
+
+def evaluate_toxicity(texts, backend=None):
+    cache_id, score_fn = _scorer(backend)
+    return pd.DataFrame(cached_scores(cache_id, texts, score_fn))
+
+
+def evaluate_toxicity_small(texts):
+    return pd.DataFrame(cached_scores(SMALL_CACHE_ID, texts, lambda batch: _predict_rows(batch, "detoxify_small")))
+
+
+def iter_toxicity(texts, chunk_size=DEFAULT_CHUNK_SIZE, backend=None):
+    # Scores any iterable of texts in fixed-size chunks, so only one chunk of texts and scores is held at a time.
+    # Each frame keeps the global row positions as its index, so concatenating them gives the same frame as evaluate_toxicity
+    cache_id, score_fn = _scorer(backend)
+    iterator = iter(texts)
+    offset = 0
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+
+        frame = pd.DataFrame(cached_scores(cache_id, chunk, score_fn))
+        frame.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield frame
+
+
+def write_toxicity(texts, path, chunk_size=DEFAULT_CHUNK_SIZE, backend=None):
+    # Writes the scores to a CSV file chunk by chunk instead of collecting them in memory. The file is written
+    # under a temporary name and moved into place when complete, and has the header even when there are no texts
+    tmp_path = os.path.join(os.path.dirname(path), "." + os.path.basename(path) + ".tmp")
+    rows = 0
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        for frame in iter_toxicity(texts, chunk_size=chunk_size, backend=backend):
+            frame.to_csv(f, header=rows == 0, index=False)
+            rows += len(frame)
+        if rows == 0:
+            pd.DataFrame(columns=CLASS_NAMES).to_csv(f, index=False)
+    os.replace(tmp_path, path)
+    return rows
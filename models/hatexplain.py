@@ -1,5 +1,7 @@
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import torch
+from evaluation import instrumentation
+from models import registry
+from models.cache import cached_scores
+from models.onnx_backend import load_onnx_classifier, resolve_backend
 
 LABEL_MAP = {
     0: "hate_speech",
@@ -7,13 +9,42 @@ LABEL_MAP = {
     2: "offensive"
 }
 
+DEFAULT_BATCH_SIZE = 32
+
 # Initial loading code was used from the Hugging face repo: https://huggingface.co/Hate-speech-CNERG/bert-base-uncased-hatexplain?text=get+out&library=transformers
 
-tokenizer = AutoTokenizer.from_pretrained("Hate-speech-CNERG/bert-base-uncased-hatexplain")
-model = AutoModelForSequenceClassification.from_pretrained("Hate-speech-CNERG/bert-base-uncased-hatexplain")
-model.eval()
+MODEL_NAME = "Hate-speech-CNERG/bert-base-uncased-hatexplain"
+CACHE_ID = f"hatexplain:{MODEL_NAME}"
+# Quantisation can flip a borderline label, so ONNX results are cached apart from the PyTorch ones
+ONNX_CACHE_ID = f"hatexplain-onnx-int8:{MODEL_NAME}"
+
+
+def _load_hatexplain():
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    model = AutoModelForSequenceClassification.from_pretrained(MODEL_NAME)
+    model.eval()
+    return tokenizer, model
+
+
+def _load_hatexplain_onnx():
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+    return load_onnx_classifier("hatexplain", tokenizer,
+                                lambda: AutoModelForSequenceClassification.from_pretrained(MODEL_NAME))
 
-def hatexplain(texts):
+
+registry.register("hatexplain", _load_hatexplain)
+registry.register("hatexplain_onnx", _load_hatexplain_onnx)
+
+
+def hatexplain_sequential(texts):
+    # Original one-text-at-a-time loop, kept as the reference for parity checks and benchmarks
+    import torch
+
+    tokenizer, model = registry.get("hatexplain")
     labels = []
     for text in texts:
         inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=False)
@@ -22,3 +53,49 @@ def hatexplain(texts):
         preds = torch.argmax(outputs.logits, dim=1).item()
         labels.append(LABEL_MAP[preds])
     return labels
+
+
+def _length_sorted_batches(input_ids, batch_size):
+    # Texts of similar token length are grouped together so each batch only pads up to its own longest text
+    order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+
+def hatexplain(texts, batch_size=DEFAULT_BATCH_SIZE, backend=None):
+    # backend is "torch" or "onnx"; by default the INFERENCE_BACKEND setting decides
+    if resolve_backend(backend) == "onnx":
+        return cached_scores(ONNX_CACHE_ID, texts, lambda batch: _hatexplain_onnx(batch, batch_size))
+    return cached_scores(CACHE_ID, texts, lambda batch: _hatexplain_batched(batch, batch_size))
+
+
+def _hatexplain_onnx(texts, batch_size):
+    texts = list(texts)
+    if not texts:
+        return []
+    classifier = registry.get("hatexplain_onnx")
+    with instrumentation.timer("model/hatexplain_onnx"):
+        logits = classifier.logits(texts, batch_size)
+    return [LABEL_MAP[pred] for pred in logits.argmax(axis=1).tolist()]
+
+
+def _hatexplain_batched(texts, batch_size):
+    import torch
+
+    texts = list(texts)
+    if not texts:
+        return []
+
+    tokenizer, model = registry.get("hatexplain")
+    encoded = tokenizer(texts, truncation=True, padding=False)["input_ids"]
+    labels = [None] * len(texts)
+
+    with torch.inference_mode(), instrumentation.timer("model/hatexplain"):
+        for batch in _length_sorted_batches(encoded, batch_size):
+            inputs = tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="pt")
+            outputs = model(**inputs)
+            preds = torch.argmax(outputs.logits, dim=1).tolist()
+            for i, pred in zip(batch, preds):
+                labels[i] = LABEL_MAP[pred]
+
+    return labels
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+
+# Optional ONNX Runtime backend for the transformer classifiers. A PyTorch sequence classifier is exported to
+# ONNX once, its weights are quantised to int8 with dynamic quantisation (activations stay fp32 and are quantised
+# on the fly), and the quantised graph is saved under ONNX_MODEL_PATH so later runs and other processes load it
+# directly. Requires the onnx and onnxruntime packages; the PyTorch path needs neither.
+#
+# INFERENCE_BACKEND selects the backend hatexplain() and evaluate_toxicity() use by default: "torch" (the
+# default) or "onnx". Both functions also take a backend argument to choose per call.
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", ".onnx_models")
+BACKENDS = ("torch", "onnx")
+OPSET = 14
+DEFAULT_BATCH_SIZE = 32
+
+
+def resolve_backend(backend=None):
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'; expected one of {BACKENDS}")
+    return backend
+
+
+def export_classifier(model, path, quantise=True):
+    # Exports a transformers sequence classifier taking input_ids and attention_mask to path, with batch and
+    # sequence length left dynamic, and replaces it with its int8 dynamically quantised version if quantise
+    import torch
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fp32_path = f"{path}.{os.getpid()}.fp32.tmp"
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    model.eval()
+    with torch.inference_mode():
+        torch.onnx.export(
+            model, (dummy, dummy), fp32_path,
+            input_names=["input_ids", "attention_mask"], output_names=["logits"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                          "logits": {0: "batch"}},
+            opset_version=OPSET, dynamo=False,
+        )
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if quantise:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    else:
+        os.replace(fp32_path, tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+class OnnxClassifier:
+    # A tokenizer and an ONNX Runtime session for one exported classifier, returning raw logits. labels names the
+    # output columns where the caller needs them
+
+    def __init__(self, tokenizer, path, labels=None, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.tokenizer = tokenizer
+        self.labels = labels
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def logits(self, texts, batch_size=DEFAULT_BATCH_SIZE):
+        # Texts are tokenized once and run in batches of similar length, each padded only to its own longest
+        # text, as on the PyTorch path. Rows come back in input order
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        encoded = self.tokenizer(texts, truncation=True, padding=False)["input_ids"]
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        out = None
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            inputs = self.tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="np")
+            feeds = {name: np.asarray(inputs[name], dtype=np.int64) for name in ("input_ids", "attention_mask")
+                     if name in self._inputs}
+            logits = self.session.run(["logits"], feeds)[0]
+            if out is None:
+                out = np.empty((len(texts), logits.shape[1]), dtype=np.float32)
+            out[batch] = logits
+        return out
+
+
+def load_onnx_classifier(name, tokenizer, load_model, labels=None, quantise=True):
+    # Loads the exported model saved under name, exporting it from load_model() first if it does not exist yet
+    path = os.path.join(ONNX_MODEL_PATH, name, "model.int8.onnx" if quantise else "model.onnx")
+    if not os.path.exists(path):
+        export_classifier(load_model(), path, quantise)
+    return OnnxClassifier(tokenizer, path, labels)
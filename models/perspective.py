@@ -1,56 +1,124 @@
-from googleapiclient import discovery
 import pandas as pd
+import json
+import random
+import threading
 import time
-from functools import lru_cache
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
 
+from evaluation import instrumentation
+from models.cache import cached_scores
+
 # Perspective API Docs was used as a reference for this implementation: https://developers.perspectiveapi.com/s/docs-sample-requests?language=en_US
 load_dotenv()
 API_KEY = os.getenv("PERSPECTIVE_API_KEY")
+CACHE_ID = "perspective:TOXICITY"
+
+# The endpoint can be pointed at a local stub server for testing
+ENDPOINT = os.getenv("PERSPECTIVE_ENDPOINT", "https://commentanalyzer.googleapis.com/v1alpha1/comments:analyze")
+
+# The default Perspective quota is 1 query per second; raise PERSPECTIVE_QPS if the project has a larger quota
+DEFAULT_QPS = float(os.getenv("PERSPECTIVE_QPS", "1"))
+DEFAULT_WORKERS = 8
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+REQUEST_TIMEOUT = 30
+
+
+class TokenBucket:
+    # Hands out at most `rate` tokens per second on average, with bursts of up to `capacity` tokens.
+    # Shared by all worker threads, so the request rate stays within quota however many requests are in flight
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def _retry_delay(attempt, retry_after=None):
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    # Exponential backoff with full jitter so that retrying workers do not fire in lockstep
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
 
-client = discovery.build("commentanalyzer", "v1alpha1", developerKey=API_KEY,discoveryServiceUrl="https://commentanalyzer.googleapis.com/$discovery/rest?version=v1alpha1", static_discovery=False)
 
-@lru_cache(maxsize=None)
-def _cached_perspective_single(text):
+def _perspective_single(text, limiter, endpoint=ENDPOINT):
 
     analyze_request = {"comment": {"text": text}, "languages": ["en"], "requestedAttributes": {"TOXICITY": {}}}
+    body = json.dumps(analyze_request).encode("utf-8")
+    url = f"{endpoint}?key={API_KEY}" if API_KEY else endpoint
 
-    response = client.comments().analyze(body=analyze_request).execute()
-
-    return (response.get("attributeScores", {}).get("TOXICITY", {}).get("summaryScore", {}).get("value", None))
-
-
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        instrumentation.count("api_calls", api="perspective")
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
 
-def evaluate_perspective(texts):
-    scores = []
-    requests_this_minute = 0
-    minute_start = time.time()
-
-    for i, text in enumerate(texts):
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                payload = json.load(response)
+            return (payload.get("attributeScores", {}).get("TOXICITY", {}).get("summaryScore", {}).get("value", None))
+
+        except urllib.error.HTTPError as e:
+            # Only rate limiting and server errors are worth retrying; anything else is a bad request or key
+            if (e.code != 429 and e.code < 500) or attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, e.headers.get("Retry-After"))
+
+        except urllib.error.URLError:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt)
+
+        instrumentation.count("api_retries", api="perspective")
+        time.sleep(delay)
+
+
+def evaluate_perspective(texts, max_workers=DEFAULT_WORKERS, qps=DEFAULT_QPS, endpoint=ENDPOINT):
+    # Only texts missing from the score cache are sent to the API, each unique text once.
+    # Failed requests come back as None and are retried on the next run
+    texts = [str(t) for t in texts]
+    scores = cached_scores(CACHE_ID, texts, lambda batch: _score_uncached(batch, max_workers, qps, endpoint))
+    return pd.DataFrame({"toxicity": scores})
 
-        if time.time() - minute_start >= 60:
-            requests_this_minute = 0
-            minute_start = time.time()
 
-        if requests_this_minute >= 45:
-            sleep_time = 60 - (time.time() - minute_start)
-            print(f"[INFO] Throttling: sleeping {sleep_time:.1f}s to avoid rate limits...")
-            time.sleep(sleep_time)
-            requests_this_minute = 0
-            minute_start = time.time()
+def _score_uncached(texts, max_workers, qps, endpoint):
+    limiter = TokenBucket(qps)
 
+    def score_one(item):
+        i, text = item
         try:
-            score = _cached_perspective_single(str(text))
+            score = _perspective_single(text, limiter, endpoint)
 
             if score is None:
-                print(f"[Warning] No score returned for text {i}")
-            scores.append(score)
+                print(f"[Warning] No score returned for uncached text {i}")
+            return score
 
         except Exception as e:
-            print(f"[Error] Failed on text {i}: {e}")
-            scores.append(None)
+            print(f"[Error] Failed on uncached text {i}: {e}")
+            instrumentation.count("api_failures", api="perspective")
+            return None
 
-        requests_this_minute += 1
-
-    return pd.DataFrame({"toxicity": scores})
+    # Several requests stay in flight while the token bucket keeps the overall rate within quota; map keeps input order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, instrumentation.timer("api/perspective"):
+        return list(executor.map(score_one, enumerate(texts)))
@@ -0,0 +1,51 @@
+import gc
+import threading
+
+# Heavy models and API clients are registered here with a loader function and only built on first use,
+# so importing a module that needs them costs nothing until it actually scores something.
+
+_loaders = {}
+_loaded = {}
+_lock = threading.RLock()
+
+
+def register(name, loader):
+    _loaders[name] = loader
+
+
+def get(name):
+    if name in _loaded:
+        return _loaded[name]
+
+    with _lock:
+        if name not in _loaded:
+            if name not in _loaders:
+                raise KeyError(f"No model registered under '{name}'. Registered: {sorted(_loaders)}")
+            _loaded[name] = _loaders[name]()
+        return _loaded[name]
+
+
+def override(name, obj):
+    # Installs an already-built object under a name, e.g. a stand-in model for benchmarks or None to disable the score cache
+    with _lock:
+        _loaded[name] = obj
+
+
+def preload(*names):
+    for name in names or list(_loaders):
+        get(name)
+
+
+def release(*names):
+    with _lock:
+        for name in names or list(_loaded):
+            _loaded.pop(name, None)
+    gc.collect()
+
+
+def is_loaded(name):
+    return name in _loaded
+
+
+def registered():
+    return sorted(_loaders)
@@ -1,285 +1,341 @@
-from data.noisyhate import load_noisyhate
+import argparse
+import os
+
+import pandas as pd
+
+from data.noisyhate import open_noisyhate
 from data.automated import automated_perturbation
 from models.detoxify_model import evaluate_toxicity
 from models.hatexplain import hatexplain
-from mitigations.normalisation import normalise_text
+from mitigations.normalisation import normalise_texts
 from mitigations.detection_spellcheck import detect_and_spellcheck
 from evaluation.results import compare_toxicity_scores
-from evaluation.label_changes import evaluate_label_changes
-from evaluation.analysis import compare_similarity, compute_levenshtein, summarise_levenshtein, compute_readability, summarise_readability
-from evaluation.visualisation import plot_bar, plot_scatter, plot_box, plot_label_changes, plot_similarity_distributions, plot_levenshtein_box, plot_readability_box
+from evaluation.label_changes import evaluate_label_changes, merge_label_changes
+from evaluation.stats import bootstrap_flip_rates, bootstrap_score_drops
+from evaluation.analysis import compare_similarity, compute_levenshtein_batch, summarise_levenshtein, compute_readability, summarise_readability
+from evaluation.readability import readability_scores
+from evaluation import instrumentation
+from evaluation.experiment import Experiment
+from evaluation.shards import checkpoint_path, read_shards, shard_bounds, write_shard
+from evaluation.visualisation import plot_bar, plot_scatter, plot_box, plot_label_changes, plot_similarity_distributions, plot_levenshtein_box, plot_readability_box, render_figures
 from models.perspective import evaluate_perspective
+from models.cache import cache_stats
 
-def main():
-    print("Loading dataset...")
-    df = load_noisyhate()
-
+# Fixed so that the automated perturbations, and everything scored from them, are reproducible between runs
+AUTO_PERTURBATION_SEED = 0
 
-    clean_texts = df["clean_version"].head(100).tolist()
-    human_texts = df["perturbed_version"].head(100).tolist()
+# Number of rows evaluated when no --limit is given; --limit 0 evaluates the whole dataset
+DEFAULT_LIMIT = 100
 
-    print("Evaluating Detoxify on clean texts...")
-    clean_scores = evaluate_toxicity(clean_texts)
+TEXT_COLUMNS = ["clean_version", "perturbed_version"]
 
-    print("Applying normalisation mitigation on unperturbed texts...")
-    clean_norm_texts = [normalise_text(t) for t in clean_texts]
-    clean_norm_scores = evaluate_toxicity(clean_norm_texts)
+# With --metrics, the run report and Prometheus metrics of each shard (and of merge) are written here
+METRICS_DIR = "metrics"
 
-    print("Applying detection + spellcheck mitigation on unperturbed texts...")
-    clean_spellcheck_texts = detect_and_spellcheck(clean_texts)
-    clean_spellcheck_scores = evaluate_toxicity(clean_spellcheck_texts)
+# The experiment matrix: every text source under every mitigation is one condition, and every condition is
+# scored by every scorer. Scorers run on the lane of the resource they use (see evaluation/experiment.py); each
+# Perspective call rate-limits itself, so only one runs at a time, alongside the local models
+SOURCES = ["unperturbed", "human", "auto"]
+MITIGATIONS = {"none": None, "norm": normalise_texts, "spellcheck": detect_and_spellcheck}
+LANES = {"cpu": 1, "perspective": 1}
 
-    print("Evaluating Detoxify on human perturbed texts...")
-    human_scores = evaluate_toxicity(human_texts)
 
-    print("Generating and evaluating detoxify on automated perturbations...")
-    auto_texts = automated_perturbation(clean_texts)
-    auto_texts = [str(t) if t is not None else "" for t in auto_texts]
-    auto_scores = evaluate_toxicity(auto_texts)
+def _perspective(texts):
+    try:
+        return evaluate_perspective(texts)
+    except Exception as e:
+        raise RuntimeError(
+            "Perspective API evaluation has failed. Please make sure that the API key is set correctly in the .env file and that you have an active internet connection."
+        ) from e
 
-    print("Applying normalisation mitigation on human perturbed texts...")
-    human_norm_texts = [normalise_text(t) for t in human_texts]
-    human_norm_scores = evaluate_toxicity(human_norm_texts)
 
-    print("Applying detection + spellcheck mitigation on human perturbed texts...")
-    human_spellcheck_texts = detect_and_spellcheck(human_texts)
-    human_spellcheck_scores = evaluate_toxicity(human_spellcheck_texts)
+SCORERS = {
+    "detoxify": (evaluate_toxicity, "cpu"),
+    "hatexplain": (hatexplain, "cpu"),
+    "perspective": (_perspective, "perspective"),
+}
 
-    print("Applying normalisation mitigation on automated perturbations...")
-    auto_norm_texts = [normalise_text(t) for t in auto_texts]
-    auto_norm_scores = evaluate_toxicity(auto_norm_texts)
 
-    print("Applying detection + spellcheck mitigation on automated perturbations...")
-    auto_spellcheck_texts = detect_and_spellcheck(auto_texts)
-    auto_spellcheck_scores = evaluate_toxicity(auto_spellcheck_texts)
+def condition_name(source, mitigation):
+    return source if mitigation == "none" else f"{source}_{mitigation}"
 
-    # HateXplain
-    print("\nRunning HateXplain on clean texts...")
-    hx_clean = hatexplain(clean_texts)
 
-    print("Running HateXplain on human-perturbed texts...")
-    hx_human = hatexplain(human_texts)
+CONDITIONS = [condition_name(source, mitigation) for source in SOURCES for mitigation in MITIGATIONS]
+PERTURBED = ["human", "auto", "human_norm", "auto_norm", "human_spellcheck", "auto_spellcheck"]
 
-    hx_human_label_stats = evaluate_label_changes(hx_clean, hx_human)
+# Names and order of the toxicity drop summaries, label-change scenarios and raw score plots
+DROP_SUMMARIES = {"human": "human_drop", "auto": "auto_drop", "unperturbed_norm": "unperturbed_norm",
+                  "unperturbed_spellcheck": "unperturbed_spellcheck", "human_norm": "human_norm",
+                  "human_spellcheck": "human_spellcheck", "auto_norm": "auto_norm",
+                  "auto_spellcheck": "auto_spellcheck"}
+LABEL_CHANGE_SCENARIOS = ["human", "auto", "human_norm", "human_spellcheck", "auto_norm", "auto_spellcheck"]
+# Each perturbation against its mitigated versions, compared by the paired bootstrap
+MITIGATION_PAIRS = [("human", "human_norm"), ("human", "human_spellcheck"), ("auto", "auto_norm"),
+                    ("auto", "auto_spellcheck")]
+PLOTTED = ["unperturbed", "human", "auto", "human_norm", "human_spellcheck", "auto_norm", "auto_spellcheck"]
 
-    print("Running HateXplain on automated perturbations...")
-    hx_auto = hatexplain(auto_texts)
 
-    hx_auto_label_stats = evaluate_label_changes(hx_clean, hx_auto)
+def _long(frames, rows):
+    # Stacks {condition: per-row frame} into one table with the condition and global row number of every row
+    return pd.concat([frame.reset_index(drop=True).assign(condition=name, row=rows)
+                      for name, frame in frames.items()], ignore_index=True)
 
-    hx_human_norm = hatexplain(human_norm_texts)
-    hx_human_spellcheck = hatexplain(human_spellcheck_texts)
 
-    hx_human_norm_label_stats = evaluate_label_changes(hx_clean, hx_human_norm)
-    hx_human_spellcheck_label_stats = evaluate_label_changes(hx_clean, hx_human_spellcheck)
+def _split(table, conditions):
+    # Inverse of _long: one frame per condition, in row order
+    return {name: table[table["condition"] == name].sort_values("row", kind="stable")
+                  .drop(columns=["condition", "row"]).reset_index(drop=True)
+            for name in conditions}
 
-    hx_auto_norm = hatexplain(auto_norm_texts)
-    hx_auto_spellcheck = hatexplain(auto_spellcheck_texts)
 
-    hx_auto_norm_label_stats = evaluate_label_changes(hx_clean, hx_auto_norm)
-    hx_auto_spellcheck_label_stats = evaluate_label_changes(hx_clean, hx_auto_spellcheck)
+def _tables(results, rows):
+    # The raw per-row tables of a run, from the results of the experiment nodes
+    def per_condition(prefix, conditions=CONDITIONS):
+        return {name: results[f"{prefix}/{name}"] for name in conditions}
 
-    hx_results = {
-    "human": hx_human_label_stats,
-    "auto": hx_auto_label_stats,
-    "human_norm": hx_human_norm_label_stats,
-    "human_spellcheck": hx_human_spellcheck_label_stats,
-    "auto_norm": hx_auto_norm_label_stats,
-    "auto_spellcheck": hx_auto_spellcheck_label_stats,
+    drop_texts = ["clean", "perturbed"]
+    human_df, auto_df = results["similarity"]
+    return {
+        "texts": pd.DataFrame({"row": rows, **per_condition("texts")}),
+        "detoxify": _long(per_condition("detoxify"), rows),
+        "perspective": _long(per_condition("perspective"), rows),
+        "hatexplain": pd.DataFrame({"row": rows, **per_condition("hatexplain")}),
+        "label_stats": pd.concat([df.assign(condition=name) for name, df in results["label_stats"].items()],
+                                 ignore_index=True),
+        "similarity": _long({"human": human_df[["similarity"]], "automated": auto_df[["similarity"]]}, rows),
+        "levenshtein": _long({name: df.drop(columns=drop_texts) for name, df in results["levenshtein"].items()}, rows),
+        "readability": _long({name: df.drop(columns=drop_texts)
+                              for name, df in per_condition("readability", PERTURBED).items()}, rows),
     }
 
-    # Perspective API
-    try:
-        print("\nEvaluating Perspective API on clean texts...")
-        persp_clean = evaluate_perspective(clean_texts)
 
-        print("Evaluating normalisation on unperturbed texts with Perspective API...")
-        persp_clean_norm = evaluate_perspective(clean_norm_texts)
+def build_experiment(clean_texts, human_texts, offset=0, checkpoint_dir=None):
+    # Declares every step of the evaluation of one contiguous block of rows, starting at row offset, as a node of
+    # the experiment DAG. The "tables" node holds the raw per-row tables that report() summarises
+    rows = list(range(offset, offset + len(clean_texts)))
+    ex = Experiment(checkpoint_dir, LANES)
 
-        print("Evaluating detection + spellcheck mitigation on unperturbed texts with Perspective API...")
-        persp_clean_spellcheck = evaluate_perspective(clean_spellcheck_texts)
+    ex.const("texts/unperturbed", list(clean_texts))
+    ex.const("texts/human", list(human_texts))
+    # Seeded by global row position, so every shard perturbs its rows exactly as an unsharded run would
+    ex.add("texts/auto", lambda clean: [str(t) if t is not None else "" for t in
+                                        automated_perturbation(clean, seed=AUTO_PERTURBATION_SEED, offset=offset)],
+           ["texts/unperturbed"])
 
-        print("Evaluating Perspective API on human perturbed texts...")
-        persp_human = evaluate_perspective(human_texts)
+    for source in SOURCES:
+        for mitigation, func in MITIGATIONS.items():
+            if func is not None:
+                ex.add(f"texts/{condition_name(source, mitigation)}", func, [f"texts/{source}"])
 
-        print("Evaluating normalisation on human perturbed texts with Perspective API...")
-        persp_human_norm = evaluate_perspective(human_norm_texts)
+    for scorer, (func, lane) in SCORERS.items():
+        for name in CONDITIONS:
+            ex.add(f"{scorer}/{name}", func, [f"texts/{name}"], lane=lane)
 
-        print("Evaluating detection + spellcheck mitigation on human perturbed texts with Perspective API...")
-        persp_human_spellcheck = evaluate_perspective(human_spellcheck_texts)
+    ex.add("label_stats", lambda clean, *perturbed: {name: evaluate_label_changes(clean, labels)
+                                                     for name, labels in zip(LABEL_CHANGE_SCENARIOS, perturbed)},
+           ["hatexplain/unperturbed", *(f"hatexplain/{name}" for name in LABEL_CHANGE_SCENARIOS)])
 
-        print("Evaluating Perspective API on automated perturbed texts...")
-        persp_auto = evaluate_perspective(auto_texts)
+    ex.add("similarity", lambda clean, human, auto: compare_similarity(clean, human, auto)[:2],
+           ["texts/unperturbed", "texts/human", "texts/auto"])
+    ex.add("levenshtein", lambda clean, *perturbed: compute_levenshtein_batch(clean, dict(zip(PERTURBED, perturbed))),
+           ["texts/unperturbed", *(f"texts/{name}" for name in PERTURBED)])
 
-        print("Evaluating normalisation on automated perturbations with Perspective API...")
-        persp_auto_norm = evaluate_perspective(auto_norm_texts)
+    ex.add("readability/unperturbed", readability_scores, ["texts/unperturbed"])
+    for name in PERTURBED:
+        ex.add(f"readability/{name}", compute_readability,
+               ["texts/unperturbed", f"texts/{name}", "readability/unperturbed"])
 
-        print("Evaluating detection + spellcheck mitigation on automated perturbations with Perspective API...")
-        persp_auto_spellcheck = evaluate_perspective(auto_spellcheck_texts)
+    deps = [f"texts/{name}" for name in CONDITIONS]
+    deps += [f"{scorer}/{name}" for scorer in SCORERS for name in CONDITIONS]
+    deps += ["label_stats", "similarity", "levenshtein", *(f"readability/{name}" for name in PERTURBED)]
+    ex.add("tables", lambda *results: _tables(dict(zip(deps, results)), rows), deps)
+    return ex
 
-        persp_results = {
-            "perspective_human_drop": compare_toxicity_scores(persp_clean, persp_human),
-            "perspective_auto_drop": compare_toxicity_scores(persp_clean, persp_auto),
-            "perspective_unperturbed_norm": compare_toxicity_scores(persp_clean, persp_clean_norm),
-            "perspective_unperturbed_spellcheck": compare_toxicity_scores(persp_clean, persp_clean_spellcheck),
-            "perspective_human_norm": compare_toxicity_scores(persp_clean, persp_human_norm),
-            "perspective_human_spellcheck": compare_toxicity_scores(persp_clean, persp_human_spellcheck),
-            "perspective_auto_norm": compare_toxicity_scores(persp_clean, persp_auto_norm),
-            "perspective_auto_spellcheck": compare_toxicity_scores(persp_clean, persp_auto_spellcheck),
-        }
 
-    except Exception as e:
-        raise RuntimeError(
-            "Perspective API evaluation has failed. Please make sure that the API key is set correctly in the .env file and that you have an active internet connection."
-        ) from e
+def evaluate(clean_texts, human_texts, offset=0, checkpoint_dir=None):
+    return build_experiment(clean_texts, human_texts, offset, checkpoint_dir).run(["tables"])["tables"]
+
+
+def report(tables, output_dir="."):
+    # Summaries and plots of a whole run, from the raw tables of evaluate() or of all shards merged
+    def out(name):
+        return os.path.join(output_dir, name)
+
+    scores = _split(tables["detoxify"], CONDITIONS)
+    persp_scores = _split(tables["perspective"], CONDITIONS)
+    label_stats = tables["label_stats"]
+    hx_results = {name: merge_label_changes([label_stats[label_stats["condition"] == name]])
+                  for name in LABEL_CHANGE_SCENARIOS}
 
     print("\nComparing Detoxify results...")
     result_summary = {
-        "detoxify_human_drop": compare_toxicity_scores(clean_scores, human_scores),
-        "detoxify_auto_drop": compare_toxicity_scores(clean_scores, auto_scores),
-        "detoxify_unperturbed_norm": compare_toxicity_scores(clean_scores, clean_norm_scores),
-        "detoxify_unperturbed_spellcheck": compare_toxicity_scores(clean_scores, clean_spellcheck_scores),
-        "detoxify_human_norm": compare_toxicity_scores(clean_scores, human_norm_scores),
-        "detoxify_human_spellcheck": compare_toxicity_scores(clean_scores, human_spellcheck_scores),
-        "detoxify_auto_norm": compare_toxicity_scores(clean_scores, auto_norm_scores),
-        "detoxify_auto_spellcheck": compare_toxicity_scores(clean_scores, auto_spellcheck_scores),
-        **persp_results
+        **{f"detoxify_{key}": compare_toxicity_scores(scores["unperturbed"], scores[name])
+           for name, key in DROP_SUMMARIES.items()},
+        **{f"perspective_{key}": compare_toxicity_scores(persp_scores["unperturbed"], persp_scores[name])
+           for name, key in DROP_SUMMARIES.items()},
     }
 
     # Printing the results
     for k, v in result_summary.items():
         print(f"\n{k}:\n{v}")
 
-    # Visualisations
-    print("\nGenerating bar chart for toxicity...")
-    plot_bar(result_summary, metric="mean_drop", save_path="results_bar.png")
-
-    print("\nGenerating label-change bar chart...")
-    plot_label_changes(hx_results, save_path="HX_label_changes.png")
-
-    print("Generating box plot...")
-
-    raw_scores = {
-        "detoxify_unperturbed": clean_scores,
-        "detoxify_human": human_scores,
-        "detoxify_auto": auto_scores,
-        "detoxify_human_norm": human_norm_scores,
-        "detoxify_human_spellcheck": human_spellcheck_scores,
-        "detoxify_auto_norm": auto_norm_scores,
-        "detoxify_auto_spellcheck": auto_spellcheck_scores,
-
-        "perspective_unperturbed": persp_clean,
-        "perspective_human": persp_human,
-        "perspective_auto": persp_auto,
-        "perspective_human_norm": persp_human_norm,
-        "perspective_human_spellcheck": persp_human_spellcheck,
-        "perspective_auto_norm": persp_auto_norm,
-        "perspective_auto_spellcheck": persp_auto_spellcheck,
+    # Bootstrap confidence intervals and paired tests, for every condition at once
+    drop_ci, drop_pairs = [], []
+    for scorer, split in (("detoxify", scores), ("perspective", persp_scores)):
+        ci, pairs = bootstrap_score_drops(split["unperturbed"]["toxicity"],
+                                          {name: split[name]["toxicity"] for name in DROP_SUMMARIES},
+                                          pairs=MITIGATION_PAIRS)
+        drop_ci.append(ci.assign(scorer=scorer))
+        drop_pairs.append(pairs.assign(scorer=scorer))
+    labels = tables["hatexplain"].sort_values("row", kind="stable")
+    label_ci, label_pairs = bootstrap_flip_rates(labels["unperturbed"],
+                                                 {name: labels[name] for name in LABEL_CHANGE_SCENARIOS},
+                                                 pairs=MITIGATION_PAIRS)
+    ci_tables = {
+        "toxicity_drop_ci.csv": pd.concat(drop_ci, ignore_index=True),
+        "toxicity_drop_pairs.csv": pd.concat(drop_pairs, ignore_index=True),
+        "label_change_ci.csv": label_ci,
+        "label_change_pairs.csv": label_pairs,
     }
-
-    plot_box(raw_scores, metric="toxicity", save_path="results_box.png")
-
-    print("Generating scatter chart to compare between detoxify and perspective...")
-    plot_scatter(
-        scores_x={
-            "unperturbed": clean_scores,
-            "human": human_scores,
-            "auto": auto_scores,
-            "human_norm": human_norm_scores,
-            "human_spellcheck": human_spellcheck_scores,
-            "auto_norm": auto_norm_scores,
-            "auto_spellcheck": auto_spellcheck_scores,
-        },
-        scores_y={
-            "unperturbed": persp_clean,
-            "human": persp_human,
-            "auto": persp_auto,
-            "human_norm": persp_human_norm,
-            "human_spellcheck": persp_human_spellcheck,
-            "auto_norm": persp_auto_norm,
-            "auto_spellcheck": persp_auto_spellcheck,
-        },
-        label_x="Detoxify Toxicity Score",
-        label_y="Perspective Toxicity Score",
-        save_path="results_scatter.png"
-    )
-
-
-    # Testing semantic similarity
-    human_df, auto_df, summary = compare_similarity(clean_texts, human_texts, auto_texts)
+    for name, df in ci_tables.items():
+        print(f"\n{name[:-4]}:\n{df.to_string(index=False)}")
+        df.to_csv(out(name), index=False)
+
+    # Semantic similarity
+    similarity = _split(tables["similarity"], ["human", "automated"])
+    summary = pd.DataFrame({
+        "type": list(similarity),
+        "mean_similarity": [df["similarity"].mean() for df in similarity.values()],
+        "median_similarity": [df["similarity"].median() for df in similarity.values()],
+        "min_similarity": [df["similarity"].min() for df in similarity.values()],
+        "max_similarity": [df["similarity"].max() for df in similarity.values()],
+    })
     print("\nSemantic similarity results:")
     print(summary)
-    plot_similarity_distributions(human_df, auto_df, save_path="semantic_similarity_boxplot.png")
-
-    # Testing Levenshtein distance
-    print("\nCalculating Levenshtein distances...")
-
-    lev_human = compute_levenshtein(clean_texts, human_texts)
-    lev_auto = compute_levenshtein(clean_texts, auto_texts)
-    lev_human_norm = compute_levenshtein(clean_texts, human_norm_texts)
-    lev_auto_norm = compute_levenshtein(clean_texts, auto_norm_texts)
-    lev_human_spellcheck = compute_levenshtein(clean_texts, human_spellcheck_texts)
-    lev_auto_spellcheck = compute_levenshtein(clean_texts, auto_spellcheck_texts)
-
-    lev_summaries = [
-        summarise_levenshtein(lev_human, "human"),
-        summarise_levenshtein(lev_auto, "auto"),
-        summarise_levenshtein(lev_human_norm, "human_norm"),
-        summarise_levenshtein(lev_auto_norm, "auto_norm"),
-        summarise_levenshtein(lev_human_spellcheck, "human_spellcheck"),
-        summarise_levenshtein(lev_auto_spellcheck, "auto_spellcheck")
-    ]
 
+    # Levenshtein distance
+    lev_results = _split(tables["levenshtein"], PERTURBED)
     print("\nLevenshtein distance summary:")
-    for item in lev_summaries:
-        print(item)
-
-    plot_levenshtein_box({
-        "human": lev_human,
-        "auto": lev_auto,
-        "human_norm": lev_human_norm,
-        "auto_norm": lev_auto_norm,
-        "human_spellcheck": lev_human_spellcheck,
-        "auto_spellcheck": lev_auto_spellcheck
-    }, save_path="levenshtein_boxplot.png")
-
-    # Flesch Reading Ease Tests
-    print("\nCalculating the change in Flesch Reading Ease scores...")
-
-    flesch_human = compute_readability(clean_texts, human_texts)
-    flesch_auto = compute_readability(clean_texts, auto_texts)
-    flesch_human_norm = compute_readability(clean_texts, human_norm_texts)
-    flesch_auto_norm = compute_readability(clean_texts, auto_norm_texts)
-    flesch_human_spellcheck = compute_readability(clean_texts, human_spellcheck_texts)
-    flesch_auto_spellcheck = compute_readability(clean_texts, auto_spellcheck_texts)
-
-    flesch_results = {
-        "human": flesch_human,
-        "auto": flesch_auto,
-        "human_norm": flesch_human_norm,
-        "auto_norm": flesch_auto_norm,
-        "human_spellcheck": flesch_human_spellcheck,
-        "auto_spellcheck": flesch_auto_spellcheck
-    }
+    for label, df in lev_results.items():
+        print(summarise_levenshtein(df, label))
 
-    flesch_summaries = [
-        summarise_readability(flesch_human, "human"),
-        summarise_readability(flesch_auto, "auto"),
-        summarise_readability(flesch_human_norm, "human_norm"),
-        summarise_readability(flesch_auto_norm, "auto_norm"),
-        summarise_readability(flesch_human_spellcheck, "human_spellcheck"),
-        summarise_readability(flesch_auto_spellcheck, "auto_spellcheck"),
+    # Flesch Reading Ease
+    flesch_results = _split(tables["readability"], PERTURBED)
+    print("\nFlesch Reading Ease change summary:")
+    for label, df in flesch_results.items():
+        print(summarise_readability(df, label))
+
+    # Visualisations. Each figure is rendered in its own worker process, and only the columns a figure draws are
+    # sent to it
+    toxicity = {f"detoxify_{name}": scores[name][["toxicity"]] for name in PLOTTED}
+    persp_toxicity = {f"perspective_{name}": persp_scores[name][["toxicity"]] for name in PLOTTED}
+    figures = [
+        (plot_bar, {"results_dict": result_summary, "metric": "mean_drop", "save_path": out("results_bar.png")}),
+        (plot_label_changes, {"results_dict": hx_results, "save_path": out("HX_label_changes.png")}),
+        (plot_box, {"results_dict": {**toxicity, **persp_toxicity}, "metric": "toxicity",
+                    "save_path": out("results_box.png")}),
+        (plot_scatter, {"scores_x": {name: toxicity[f"detoxify_{name}"] for name in PLOTTED},
+                        "scores_y": {name: persp_toxicity[f"perspective_{name}"] for name in PLOTTED},
+                        "label_x": "Detoxify Toxicity Score", "label_y": "Perspective Toxicity Score",
+                        "save_path": out("results_scatter.png")}),
+        (plot_similarity_distributions, {"human_df": similarity["human"][["similarity"]],
+                                         "auto_df": similarity["automated"][["similarity"]],
+                                         "save_path": out("semantic_similarity_boxplot.png")}),
+        (plot_levenshtein_box, {"results": {name: df[["lev_distance"]] for name, df in lev_results.items()},
+                                "save_path": out("levenshtein_boxplot.png")}),
+        (plot_readability_box, {"results": {name: df[["flesch_change"]] for name, df in flesch_results.items()},
+                                "save_path": out("flesch_change_boxplot.png")}),
     ]
+    print(f"\nRendering {len(figures)} figures...")
+    render_figures(figures)
 
-    print("\nFlesch Reading Ease change summary:")
-    for item in flesch_summaries:
-        print(item)
 
-    plot_readability_box(flesch_results, save_path="flesch_change_boxplot.png")
+def run(limit=DEFAULT_LIMIT, shard_index=0, num_shards=1, output_dir=".", resume=True):
+    print("Loading dataset...")
+    with instrumentation.stage("load_dataset"):
+        table = open_noisyhate(columns=TEXT_COLUMNS, verbose=True)
+    n_rows = min(limit, len(table)) if limit else len(table)
+    start, stop = shard_bounds(n_rows, shard_index, num_shards)
+    print(f"Evaluating rows {start} to {stop} of {n_rows} (shard {shard_index + 1} of {num_shards})")
+
+    meta = {"limit": limit, "rows": n_rows, "start": start, "stop": stop, "seed": AUTO_PERTURBATION_SEED}
+    checkpoints = checkpoint_path(output_dir, shard_index, num_shards, meta, resume)
+
+    df = table.slice(start, stop - start).to_pandas()
+    # Every experiment node is a stage of its own, so this one is only timed
+    with instrumentation.stage("evaluate", profile=False):
+        tables = evaluate(df["clean_version"].tolist(), df["perturbed_version"].tolist(), start, checkpoints)
+
+    with instrumentation.stage("write_shard"):
+        path = write_shard(output_dir, shard_index, num_shards, tables, meta)
+    print(f"\nRaw outputs written to {path}")
+
+    if num_shards == 1:
+        with instrumentation.stage("report"):
+            report(tables, output_dir)
+    else:
+        print("Run the merge command once every shard has finished to produce the summaries and plots.")
+
+    print("\nScore cache hits and misses:")
+    for model_id, counts in cache_stats().items():
+        print(f"{model_id}: {counts}")
+
+    _write_metrics(output_dir, f"{shard_index:05d}-of-{num_shards:05d}")
+    print("\nExperiment complete.")
 
 
+def merge(output_dir="."):
+    with instrumentation.stage("read_shards"):
+        meta, tables = read_shards(output_dir)
+    print(f"Merged {meta['num_shards']} shards covering {meta['rows']} rows")
+    with instrumentation.stage("report"):
+        report(tables, output_dir)
+    _write_metrics(output_dir, "merge")
+
+
+def _write_metrics(output_dir, name):
+    path = os.path.join(output_dir, METRICS_DIR, f"{name}.json")
+    run_report = instrumentation.write_report(path)
+    if run_report is None:
+        return
+
+    print(f"\nRun report written to {path} (Prometheus metrics in {os.path.splitext(path)[0]}.prom)")
+    print(f"Wall time {run_report['wall_seconds']:.1f}s, peak RSS {run_report['peak_rss_mb'] or 0:.0f} MB. "
+          "Slowest stages:")
+    stages = sorted(run_report["stages"], key=lambda s: s["seconds"], reverse=True)
+    for record in stages[:5]:
+        print(f"  {record['name']}: {record['seconds']:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Evaluate toxicity classifiers on clean, perturbed and mitigated texts")
+    parser.add_argument("command", nargs="?", choices=["run", "merge"], default="run",
+                        help="run evaluates one shard of the rows; merge combines the shards of a run")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT,
+                        help=f"evaluate only the first LIMIT rows, 0 for all (default {DEFAULT_LIMIT})")
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--num-shards", type=int, default=1)
+    parser.add_argument("--output-dir", default=".", help="where shard outputs, and merged plots, are written")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="recompute every step instead of resuming from the checkpoints of an interrupted run")
+    parser.add_argument("--metrics", action="store_true",
+                        help=f"time every stage and model call and write a run report to OUTPUT_DIR/{METRICS_DIR}")
+    parser.add_argument("--profile", action="store_true",
+                        help="also capture a cProfile of every stage (implies --metrics)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also take tracemalloc snapshots after every stage; slows the run (implies --metrics)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.metrics or args.profile or args.trace_memory:
+        profile_dir = os.path.join(args.output_dir, METRICS_DIR, "profiles") if args.profile else None
+        instrumentation.enable(profile=args.profile, trace_memory=args.trace_memory, profile_dir=profile_dir)
+    if args.command == "merge":
+        merge(args.output_dir)
+    else:
+        run(args.limit, args.shard_index, args.num_shards, args.output_dir, resume=not args.no_resume)
 
-    print("\nExperiment complete.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Empty, Queue
+
+import numpy as np
+
+# Dynamic micro-batching for request/response serving. Callers submit single items from any number of threads
+# and get a Future back; one worker thread collects whatever is queued into a batch, closing it when it holds
+# max_batch_size items or max_wait seconds after its first item arrived, runs the whole batch through
+# process_fn in one call and resolves every item's Future with its own result.
+
+DEFAULT_MAX_BATCH_SIZE = 32
+DEFAULT_MAX_WAIT = 0.01
+LATENCY_WINDOW = 10_000
+
+
+class ServingStats:
+    # Request latencies (queueing plus processing) of the last `window` requests, and batch counts since start
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.batches = 0
+        self._latencies = deque(maxlen=window)
+        self._completed = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_batch(self, latencies, failed=False):
+        now = time.monotonic()
+        with self._lock:
+            self.batches += 1
+            self.requests += len(latencies)
+            if failed:
+                self.errors += len(latencies)
+            self._latencies.extend(latencies)
+            self._completed.extend([now] * len(latencies))
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=np.float64) * 1000
+            completed = np.array(self._completed, dtype=np.float64)
+            requests, errors, batches = self.requests, self.errors, self.batches
+
+        now = time.monotonic()
+        # Throughput over the requests still in the window, or since start while the window is not yet full
+        span = now - (completed[0] if len(completed) == self._completed.maxlen else self.started)
+        return {
+            "requests": requests,
+            "errors": errors,
+            "batches": batches,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "throughput_rps": len(completed) / span if span > 0 else 0.0,
+            "latency_ms": {
+                "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+                "p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+                "mean": float(latencies.mean()) if len(latencies) else None,
+                "max": float(latencies.max()) if len(latencies) else None,
+            },
+            "uptime_s": now - self.started,
+        }
+
+
+class MicroBatcher:
+
+    def __init__(self, process_fn, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT, stats=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.process_fn = process_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.stats = stats if stats is not None else ServingStats()
+        self._queue = Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def close(self):
+        # Stops accepting items; anything already queued is still processed before the worker exits
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except Empty:
+                break
+            if entry is None:
+                # Put the sentinel back so the worker stops after this batch
+                self._queue.put(None)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+
+            items = [item for item, _, _ in batch]
+            try:
+                results = list(self.process_fn(items))
+                if len(results) != len(items):
+                    raise RuntimeError(f"process_fn returned {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = True
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+                failed = False
+
+            now = time.monotonic()
+            self.stats.record_batch([now - submitted for _, _, submitted in batch], failed)
@@ -0,0 +1,155 @@
+import argparse
+import json
+from concurrent.futures import TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from models import registry
+from serving.batcher import DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT, MicroBatcher
+
+# Local moderation service: the mitigate-then-classify pipeline behind a small HTTP API.
+#
+#   POST /moderate   {"text": "..."}  ->  {"text": <mitigated text>, "scores": {<Detoxify scores>}, "label": ...}
+#   GET  /stats      request, batch and latency statistics
+#   GET  /healthz
+#
+# Every request is one text. Concurrent requests are micro-batched, so each batch is mitigated and goes through
+# Detoxify and HateXplain in one batched call each, and every request is answered with its own result.
+# Run from the repository root: python -m serving.server --port 8080
+
+REQUEST_TIMEOUT = 30
+MAX_BODY_BYTES = 1_000_000
+
+
+def _mitigation(name):
+    if name == "none":
+        return None
+    if name == "norm":
+        from mitigations.normalisation import normalise_texts
+        return normalise_texts
+    if name == "spellcheck":
+        from mitigations.detection_spellcheck import detect_and_spellcheck
+        return detect_and_spellcheck
+    raise ValueError(f"Unknown mitigation '{name}'; expected none, norm or spellcheck")
+
+
+def moderation_pipeline(mitigation="norm", labels=True):
+    # Returns process_fn for the batcher: texts in, one result dict per text out
+    from models.detoxify_model import evaluate_toxicity
+    from models.hatexplain import hatexplain
+
+    mitigate = _mitigation(mitigation)
+
+    def process(texts):
+        texts = mitigate(texts) if mitigate is not None else list(texts)
+        scores = evaluate_toxicity(texts).to_dict("records")
+        predicted = hatexplain(texts) if labels else [None] * len(texts)
+        return [{"text": text, "scores": row, "label": label} for text, row, label in zip(texts, scores, predicted)]
+
+    return process
+
+
+def make_handler(batcher):
+
+    class ModerationHandler(BaseHTTPRequestHandler):
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, batcher.stats.snapshot())
+            elif self.path == "/healthz":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            if self.path != "/moderate":
+                self._send(404, {"error": f"Unknown path {self.path}"})
+                return
+
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BODY_BYTES:
+                self._send(413, {"error": f"Request body is larger than {MAX_BODY_BYTES} bytes"})
+                return
+            try:
+                text = json.loads(self.rfile.read(length))["text"]
+                if not isinstance(text, str):
+                    raise TypeError
+            except (ValueError, KeyError, TypeError):
+                self._send(400, {"error": 'Expected a JSON body of the form {"text": "..."}'})
+                return
+
+            try:
+                result = batcher.submit(text).result(timeout=REQUEST_TIMEOUT)
+            except TimeoutError:
+                self._send(504, {"error": f"No result within {REQUEST_TIMEOUT}s"})
+                return
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, result)
+
+        def log_message(self, *args):
+            pass
+
+    return ModerationHandler
+
+
+class ModerationServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 drops connections from bursts of concurrent clients, which then wait a full
+    # SYN retransmit (about a second) before being accepted
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_server(process_fn, host="127.0.0.1", port=8080, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                max_wait=DEFAULT_MAX_WAIT):
+    # Returns (server, batcher); call server.serve_forever() to start answering, and server.shutdown() followed
+    # by batcher.close() to stop
+    batcher = MicroBatcher(process_fn, max_batch_size, max_wait)
+    server = ModerationServer((host, port), make_handler(batcher))
+    return server, batcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the moderation pipeline over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT * 1000)
+    parser.add_argument("--mitigation", choices=["none", "norm", "spellcheck"], default="norm")
+    parser.add_argument("--no-labels", action="store_true", help="skip HateXplain and return Detoxify scores only")
+    parser.add_argument("--no-cache", action="store_true", help="score every request instead of using the score cache")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        registry.override("score_cache", None)
+
+    pipeline = moderation_pipeline(args.mitigation, not args.no_labels)
+
+    # Loaded before the first request rather than inside it
+    print("Loading models...")
+    registry.preload("detoxify", *(() if args.no_labels else ("hatexplain",)))
+    if args.mitigation == "spellcheck":
+        registry.preload("symspell")
+
+    server, batcher = make_server(pipeline, args.host, args.port, args.max_batch_size, args.max_wait_ms / 1000)
+    print(f"Serving on http://{args.host}:{server.server_address[1]} "
+          f"(max batch size {args.max_batch_size}, max wait {args.max_wait_ms}ms)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    main()